@@ -0,0 +1,169 @@
+""" This module implements the asyncio counterpart of
+:class:`espmu.streaming.PmuStreamDataReader`. Many readers can share
+single event loop instead of using a thread per connection. """
+
+import asyncio
+
+from espmu.framer import Framer
+from espmu.pmuCommandFrame import CommandFrame
+from espmu.pmuConfigFrame import ConfigFrame
+from espmu.pmuDataFrame import DataFrame
+from espmu.pmuEnum import FrameType
+
+CONFIG_FRAME_TYPES = (FrameType.Config1.value, FrameType.Config2.value,
+                      FrameType.Config3.value)
+
+
+def frame_type(frame):
+    """ Return type of frame (see :class:`espmu.pmuEnum.FrameType`). """
+    return (frame[1] >> 4) & 7
+
+
+class _PmuProtocol(asyncio.BufferedProtocol):
+    """ Protocol receiving bytes directly into the framer buffer. """
+    def __init__(self, reader):
+        self.reader = reader
+        self.framer = Framer()
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def get_buffer(self, sizehint):
+        return self.framer.recv_buffer()
+
+    def buffer_updated(self, nbytes):
+        for frame in self.framer.received(nbytes):
+            self.reader._on_frame(frame)
+
+    def eof_received(self):
+        return False
+
+    def connection_lost(self, exc):
+        self.reader._on_lost(exc)
+
+
+class AsyncPmuStreamDataReader:
+    """ Asynchronous data reader.
+
+    :param queue_size: Maximal number of received data frames waiting
+        for consumer. When the queue is full reading from socket is
+        paused.
+    :type queue_size: int
+    """
+    def __init__(self, queue_size=1000):
+        self.__idcode = None
+        self.__transport = None
+        self.__protocol = None
+        self.__conf_frame = None
+        self.__conf_waiter = None
+        self.__data_on = False
+        self.__paused = False
+        self.__queue_size = queue_size
+        self.__queue = None
+
+    async def connect(self, ip_addr, tcp_port, idcode, timeout=5):
+        """ Connect to PDC or PMU and get config frame 2.
+
+        :return: True if connected and config frame is received, else
+            False
+        """
+        self.__idcode = idcode
+        self.__queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        try:
+            self.__transport, self.__protocol = await asyncio.wait_for(
+                loop.create_connection(
+                    lambda: _PmuProtocol(self), ip_addr, tcp_port),
+                timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+
+        self.__send("DATAOFF")
+        self.__conf_waiter = loop.create_future()
+        self.__send("CONFIG2")
+        try:
+            self.__conf_frame = await asyncio.wait_for(
+                self.__conf_waiter, timeout)
+        except (ConnectionError, asyncio.TimeoutError):
+            await self.disconnect()
+            return False
+        finally:
+            self.__conf_waiter = None
+        return True
+
+    async def disconnect(self):
+        """ Disconnect from PDC or PMU. """
+        if self.__transport:
+            self.__transport.close()
+            self.__transport = None
+        self.__data_on = False
+
+    def is_data_on(self):
+        """ Check if data stream is on. """
+        return self.__data_on
+
+    def config_frame(self):
+        """ Return config frame. """
+        return self.__conf_frame
+
+    async def start(self):
+        """ Start data stream. """
+        self.__send("DATAON")
+        self.__data_on = True
+
+    async def stop(self):
+        """ Stop data stream. """
+        self.__send("DATAOFF")
+        self.__data_on = False
+
+    def __aiter__(self):
+        return self.frames()
+
+    async def frames(self):
+        """ Asynchronous iterator of data frames. It ends when the
+        connection is closed.
+
+        :raises ConnectionError: If connection is lost because of error
+        """
+        while True:
+            item = await self.__queue.get()
+            if self.__paused and \
+               self.__queue.qsize() <= self.__queue_size // 2:
+                self.__paused = False
+                if self.__transport:
+                    self.__transport.resume_reading()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield DataFrame.fromBytes(item, self.__conf_frame)
+
+    def __send(self, command):
+        cmd = CommandFrame(command, self.__idcode)
+        self.__transport.write(cmd.fullFrameBytes)
+
+    def _on_frame(self, frame):
+        ftype = frame_type(frame)
+        if ftype in CONFIG_FRAME_TYPES:
+            conf_frame = ConfigFrame.fromBytes(frame)
+            if self.__conf_waiter and not self.__conf_waiter.done():
+                self.__conf_waiter.set_result(conf_frame)
+            else:
+                self.__conf_frame = conf_frame
+            return
+        if ftype != FrameType.Data.value or self.__conf_frame is None:
+            return
+        self.__queue.put_nowait(frame)
+        if not self.__paused and self.__queue.qsize() >= self.__queue_size:
+            self.__paused = True
+            self.__transport.pause_reading()
+
+    def _on_lost(self, exc):
+        self.__transport = None
+        self.__data_on = False
+        if self.__conf_waiter and not self.__conf_waiter.done():
+            self.__conf_waiter.set_exception(
+                exc or ConnectionError("Connection is closed"))
+        if self.__queue is not None:
+            self.__queue.put_nowait(exc)
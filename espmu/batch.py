@@ -0,0 +1,145 @@
+""" In this module the batch decoder of data frames is implemented.
+Many data frames are decoded at once into NumPy arrays using
+structured big-endian dtype, without creating Python objects for each
+frame. NumPy is required for this module. """
+
+import numpy as np
+
+
+def _num_type(num_type):
+    return '>i2' if num_type == "INTEGER" else '>f4'
+
+
+def frame_dtype(config_frame):
+    """ Return structured dtype of data frame described by config frame.
+
+    :param config_frame: Config frame
+    :type config_frame: ConfigFrame
+    """
+    fields = [
+        ('sync', '>u2'),
+        ('framesize', '>u2'),
+        ('idcode', '>u2'),
+        ('soc', '>u4'),
+        ('fracsec', '>u4'),
+    ]
+    for i, station in enumerate(config_frame.stations):
+        fields.append(('stat{}'.format(i), '>u2'))
+        if station.phnmr:
+            fields.append(('phasors{}'.format(i),
+                           _num_type(station.phsrType), (station.phnmr, 2)))
+        fields.append(('freq{}'.format(i), _num_type(station.freqType)))
+        fields.append(('dfreq{}'.format(i), _num_type(station.freqType)))
+        if station.annmr:
+            fields.append(('analogs{}'.format(i),
+                           _num_type(station.anlgType), (station.annmr,)))
+        if station.dgnmr:
+            fields.append(('digitals{}'.format(i), '>u2', (station.dgnmr,)))
+    fields.append(('chk', '>u2'))
+    return np.dtype(fields)
+
+
+class BatchData:
+    """ Columnar data decoded from number of data frames.
+
+    Arrays of stations are lists indexed by station, the first axis of
+    every array is the index of frame.
+
+    * ``soc``, ``fracsec``, ``tq`` -- time fields of frames
+    * ``time`` -- UTC time in seconds (float)
+    * ``time_ns`` -- UTC time in nanoseconds (int64)
+    * ``stat``, ``freq``, ``dfreq`` -- arrays of shape (frames, stations)
+    * ``mag``, ``rad`` -- per station arrays of shape (frames, phasors)
+    * ``analogs``, ``digitals`` -- per station arrays of shape
+      (frames, channels)
+    """
+    def __init__(self, frames, config_frame):
+        num_pmu = config_frame.num_pmu
+        time_base = config_frame.time_base.baseDecStr
+
+        self.config_frame = config_frame
+        self.soc = frames['soc'].astype(np.int64)
+        self.tq = (frames['fracsec'] >> 24).astype(np.uint8)
+        self.fracsec = (frames['fracsec'] & 0xFFFFFF).astype(np.int64)
+        self.time_ns = self.soc * 10**9 + self.fracsec * 10**9 // time_base
+        self.time = self.soc + self.fracsec / time_base
+
+        self.stat = np.empty((len(frames), num_pmu), dtype=np.uint16)
+        self.freq = np.empty((len(frames), num_pmu))
+        self.dfreq = np.empty((len(frames), num_pmu))
+        self.mag = [None]*num_pmu
+        self.rad = [None]*num_pmu
+        self.analogs = [None]*num_pmu
+        self.digitals = [None]*num_pmu
+
+        for i, station in enumerate(config_frame.stations):
+            self.stat[:, i] = frames['stat{}'.format(i)]
+            self.freq[:, i] = frames['freq{}'.format(i)]
+            self.dfreq[:, i] = frames['dfreq{}'.format(i)].astype(
+                np.float64) / 100
+            self.__parse_phasors(frames, i, station)
+            self.analogs[i] = _field(
+                frames, 'analogs{}'.format(i), station.annmr, np.float64)
+            self.digitals[i] = _field(
+                frames, 'digitals{}'.format(i), station.dgnmr, np.uint16)
+
+    def __len__(self):
+        return len(self.time)
+
+    def __parse_phasors(self, frames, i, station):
+        values = _field(frames, 'phasors{}'.format(i), (station.phnmr, 2),
+                        np.float64)
+        val1 = values[:, :, 0]
+        val2 = values[:, :, 1]
+        if station.phsrFmt == "RECT":
+            self.mag[i] = np.hypot(val1, val2)
+            self.rad[i] = np.arctan2(val2, val1)
+        else:
+            self.mag[i] = val1
+            self.rad[i] = val2 / 10000 if station.phsrType == "INTEGER" \
+                else val2
+
+
+def _field(frames, name, shape, dtype):
+    if not isinstance(shape, tuple):
+        shape = (shape,)
+    if name not in frames.dtype.names:
+        return np.empty((len(frames),) + shape, dtype=dtype)
+    return frames[name].astype(dtype)
+
+
+def view_frames(frames_bytes, config_frame):
+    """ Return structured array viewing data frames without copying.
+
+    :param frames_bytes: Concatenated data frames
+    :type frames_bytes: bytes/bytearray/memoryview
+    :param config_frame: Config frame describing data frames
+    :type config_frame: ConfigFrame
+
+    :raises ValueError: If the buffer does not consist of whole data
+        frames described by config frame
+    """
+    dtype = frame_dtype(config_frame)
+    if len(frames_bytes) % dtype.itemsize:
+        raise ValueError(
+            "Buffer size {} is not multiple of frame size {}".format(
+                len(frames_bytes), dtype.itemsize))
+    frames = np.frombuffer(frames_bytes, dtype=dtype)
+    if len(frames) and (np.any(frames['sync'] >> 8 != 0xAA) or
+                        np.any(frames['framesize'] != dtype.itemsize)):
+        raise ValueError("Buffer contains unexpected frames")
+    return frames
+
+
+def decode_frames(frames_bytes, config_frame):
+    """ Decode number of concatenated data frames into columnar arrays.
+
+    :param frames_bytes: Concatenated data frames
+    :type frames_bytes: bytes/bytearray/memoryview
+    :param config_frame: Config frame describing data frames
+    :type config_frame: ConfigFrame
+
+    :return: Decoded data
+    :rtype: BatchData
+    """
+    return BatchData(view_frames(frames_bytes, config_frame), config_frame)
@@ -0,0 +1,151 @@
+""" In this module the bounded buffer of frames between receiving and
+consuming is implemented. When the consumer is slower than the data
+source, the buffer either blocks the receiver or sheds frames according
+to the policy (see :class:`espmu.pmuEnum.BufferPolicy`), and shed
+frames are counted. """
+
+import collections
+import threading
+import time
+
+from espmu.pmuEnum import BufferPolicy
+from espmu.pmuFrame import HEADER_STRUCT
+
+BUFFER_SIZE = 1000
+
+
+class FrameBuffer:
+    """ Thread-safe bounded buffer of frames.
+
+    Policies:
+
+    * BLOCK -- :meth:`put` waits for free space
+    * DROP_OLDEST -- the oldest frame is dropped to make room
+    * DROP_NEWEST -- the new frame is dropped
+    * DECIMATE -- while the buffer is more than half full only one frame
+      per 1/fps second (by frame timestamp) is kept; the new frame is
+      dropped if the buffer is full anyway
+
+    :param size: Max number of frames
+    :type size: int
+    :param policy: Policy of overload
+    :type policy: BufferPolicy
+    :param fps: Rate of frames (frames per second) for DECIMATE policy
+    :type fps: int
+    :param time_base: TIME_BASE of data source for DECIMATE policy
+    :type time_base: int
+    """
+    def __init__(self, size=BUFFER_SIZE, policy=BufferPolicy.BLOCK,
+                 fps=None, time_base=None):
+        if policy == BufferPolicy.DECIMATE and not (fps and time_base):
+            raise ValueError("fps and time_base are required to decimate")
+        self.size = size
+        self.policy = policy
+        self.fps = fps
+        self.time_base = time_base
+
+        self.put_num = 0
+        self.shed_num = 0
+        self.max_level = 0
+
+        self.__frames = collections.deque()
+        self.__cond = threading.Condition()
+        self.__closed = False
+        self.__last_slot = None
+
+    def __len__(self):
+        return len(self.__frames)
+
+    def put(self, frame, timeout=None):
+        """ Put frame into the buffer.
+
+        :param frame: Frame bytes
+        :type frame: bytes
+        :param timeout: Max time to wait for free space (BLOCK policy),
+            None means forever
+        :type timeout: float
+        :return: True if the frame is put, False if it is shed
+        """
+        with self.__cond:
+            self.put_num += 1
+            if self.__closed or not self.__make_room(frame, timeout):
+                self.shed_num += 1
+                return False
+            self.__frames.append(frame)
+            self.max_level = max(self.max_level, len(self.__frames))
+            self.__cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """ Take the oldest frame.
+
+        :param timeout: Max time to wait for frame, None means forever
+        :type timeout: float
+        :return: Frame or None if there are no frames during timeout or
+            the buffer is closed
+        """
+        frames = self.get_all(1, timeout)
+        return frames[0] if frames else None
+
+    def get_all(self, max_num=None, timeout=None):
+        """ Wait for frames and take all (at most max_num) of them.
+
+        :param max_num: Max number of frames
+        :type max_num: int
+        :param timeout: Max time to wait for frame, None means forever
+        :type timeout: float
+        :return: List of frames, empty if there are no frames during
+            timeout or the buffer is closed
+        """
+        with self.__cond:
+            self.__cond.wait_for(
+                lambda: self.__frames or self.__closed, timeout)
+            num = len(self.__frames)
+            if max_num is not None:
+                num = min(num, max_num)
+            frames = [self.__frames.popleft() for _ in range(num)]
+            if frames:
+                self.__cond.notify_all()
+            return frames
+
+    def close(self):
+        """ Close the buffer and wake up all waiting threads. Frames
+        which are in the buffer still can be taken. """
+        with self.__cond:
+            self.__closed = True
+            self.__cond.notify_all()
+
+    def is_closed(self):
+        """ Check if the buffer is closed. """
+        return self.__closed
+
+    def __make_room(self, frame, timeout):
+        frames = self.__frames
+        if self.policy == BufferPolicy.DECIMATE:
+            slot = self.__slot(frame)
+            if len(frames) > self.size // 2 and slot == self.__last_slot:
+                return False
+            self.__last_slot = slot
+        if len(frames) < self.size:
+            return True
+
+        if self.policy == BufferPolicy.BLOCK:
+            deadline = None if timeout is None else \
+                time.monotonic() + timeout
+            while len(frames) >= self.size and not self.__closed:
+                remaining = None if deadline is None else \
+                    deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.__cond.wait(remaining)
+            return not self.__closed
+        if self.policy == BufferPolicy.DROP_OLDEST:
+            frames.popleft()
+            self.shed_num += 1
+            return True
+        return False
+
+    def __slot(self, frame):
+        _, _, _, soc, fracsec = HEADER_STRUCT.unpack_from(frame)
+        ticks = soc * self.time_base + (fracsec & 0xFFFFFF)
+        return ticks * self.fps // self.time_base
@@ -0,0 +1,401 @@
+""" In this module the recorder of raw C37.118 frames is implemented.
+
+Frames are appended to segment files as they are received, so every
+segment is a valid byte stream of frames. Each segment has two side
+files:
+
+* index (``.idx``) -- sparse list of records (time in nanoseconds,
+  offset of frame in segment) written not more often than once per index
+  interval; times in the index never decrease
+* configs (``.cfg``) -- every version of config frame seen in the
+  segment (the config frames known at the start of segment are copied
+  there too), each one is preceded by its offset in segment (8 bytes)
+
+Segments are named ``<prefix>-<number>.pmu``. They are read back by
+:class:`CaptureReader`. """
+
+import bisect
+import glob
+import mmap
+import os
+import struct
+
+from espmu.framer import MIN_FRAME_SIZE, SYNC_BYTE
+from espmu.pmuConfigFrame import ConfigFrame
+from espmu.pmuDataFrame import DataFrame
+from espmu.pmuEnum import FrameType
+from espmu.pmuFrame import HEADER_STRUCT, NS_IN_SEC
+
+SEGMENT_EXT = ".pmu"
+INDEX_EXT = ".idx"
+CONFIGS_EXT = ".cfg"
+INDEX_STRUCT = struct.Struct('!qQ')
+OFFSET_STRUCT = struct.Struct('!Q')
+
+SEGMENT_SIZE = 256 * 1024**2
+INDEX_INTERVAL = NS_IN_SEC
+WRITE_BUFFER_SIZE = 1024**2
+
+CONFIG_FRAME_TYPES = (FrameType.Config1.value, FrameType.Config2.value,
+                      FrameType.Config3.value)
+
+
+def segment_path(directory, prefix, number):
+    """ Return path of segment file (without extension). """
+    return os.path.join(directory, "{}-{:06d}".format(prefix, number))
+
+
+def frame_time_ns(frame, time_base=None):
+    """ Return time of frame in nanoseconds. Fraction of second is
+    ignored if time_base is unknown. """
+    _, _, _, soc, fracsec = HEADER_STRUCT.unpack_from(frame)
+    if not time_base:
+        return soc * NS_IN_SEC
+    return soc * NS_IN_SEC + (fracsec & 0xFFFFFF) * NS_IN_SEC // time_base
+
+
+def config_time_base(frame):
+    """ Return TIME_BASE of config frame (bytes). """
+    return struct.unpack_from('!I', frame, 14)[0] & 0xFFFFFF
+
+
+class CaptureRecorder:
+    """ Recorder of raw frames into segment files.
+
+    Recorder can be set to :class:`espmu.client.Client` or
+    :class:`espmu.server.Server` (see ``setRecorder``), then every frame
+    they read is recorded.
+
+    :param directory: Directory of segment files
+    :type directory: str
+    :param prefix: Prefix of names of segment files
+    :type prefix: str
+    :param segment_size: Size of segment (bytes) after which the next
+        segment is started
+    :type segment_size: int
+    :param index_interval: Min time (nanoseconds) between index records
+    :type index_interval: int
+    :param buffer_size: Size of write buffer
+    :type buffer_size: int
+    """
+    def __init__(self, directory, prefix="capture",
+                 segment_size=SEGMENT_SIZE, index_interval=INDEX_INTERVAL,
+                 buffer_size=WRITE_BUFFER_SIZE):
+        self.directory = directory
+        self.prefix = prefix
+        self.segment_size = segment_size
+        self.index_interval = index_interval
+        self.buffer_size = buffer_size
+
+        self.frames_num = 0
+        self.bytes_num = 0
+        self.segment_num = -1
+
+        self.__configs = {}
+        self.__time_bases = {}
+        self.__segment = None
+        self.__index = None
+        self.__configs_file = None
+        self.__offset = 0
+        self.__index_time = None
+        self.__max_time = None
+
+        os.makedirs(directory, exist_ok=True)
+        self.__start_segment()
+
+    def write(self, frame):
+        """ Record frame.
+
+        :param frame: Frame bytes
+        :type frame: bytes/bytearray/memoryview
+        """
+        if len(frame) < MIN_FRAME_SIZE:
+            return
+        if self.__offset >= self.segment_size:
+            self.__close_segment()
+            self.__start_segment()
+
+        idcode = (frame[4] << 8) | frame[5]
+        if (frame[1] >> 4) & 7 in CONFIG_FRAME_TYPES:
+            self.__on_config(idcode, bytes(frame))
+
+        time_ns = frame_time_ns(frame, self.__time_bases.get(idcode))
+        if self.__max_time is None or time_ns > self.__max_time:
+            self.__max_time = time_ns
+        if self.__index_time is None or \
+           self.__max_time - self.__index_time >= self.index_interval:
+            self.__index_time = self.__max_time
+            self.__index.write(
+                INDEX_STRUCT.pack(self.__max_time, self.__offset))
+
+        self.__segment.write(frame)
+        self.__offset += len(frame)
+        self.bytes_num += len(frame)
+        self.frames_num += 1
+
+    def write_frames(self, frames):
+        """ Record number of frames. """
+        for frame in frames:
+            self.write(frame)
+
+    def flush(self):
+        """ Flush buffers of files. """
+        for file in (self.__segment, self.__index, self.__configs_file):
+            file.flush()
+
+    def close(self):
+        """ Flush and close files. """
+        if self.__segment is not None:
+            self.__close_segment()
+
+    def __on_config(self, idcode, frame):
+        last = self.__configs.get(idcode)
+        # versions differ in content, not in time of sending
+        if last is not None and last[14:-2] == frame[14:-2]:
+            return
+        self.__configs[idcode] = frame
+        self.__time_bases[idcode] = config_time_base(frame)
+        self.__configs_file.write(OFFSET_STRUCT.pack(self.__offset))
+        self.__configs_file.write(frame)
+
+    def __start_segment(self):
+        self.segment_num += 1
+        path = segment_path(self.directory, self.prefix, self.segment_num)
+        self.__segment = open(path + SEGMENT_EXT, 'wb',
+                              buffering=self.buffer_size)
+        self.__index = open(path + INDEX_EXT, 'wb')
+        self.__configs_file = open(path + CONFIGS_EXT, 'wb')
+        for frame in self.__configs.values():
+            self.__configs_file.write(OFFSET_STRUCT.pack(0))
+            self.__configs_file.write(frame)
+        self.__offset = 0
+        self.__index_time = None
+
+    def __close_segment(self):
+        for file in (self.__segment, self.__index, self.__configs_file):
+            file.close()
+        self.__segment = None
+        self.__index = None
+        self.__configs_file = None
+
+
+class CaptureSegment:
+    """ Segment of capture: its time index and config frames, and
+    the segment file mapped into memory by :meth:`open`.
+
+    * ``times``, ``offsets`` -- records of the index
+    * ``configs`` -- list of tuples (offset, config frame bytes)
+    * ``map``, ``view`` -- mapping (mmap, None for empty segment) and
+      its memoryview while the segment is open
+
+    :param path: Path of segment files without extension
+    :type path: str
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path + INDEX_EXT, 'rb') as file:
+            index = file.read()
+        records = [INDEX_STRUCT.unpack_from(index, pos) for pos in
+                   range(0, len(index) - INDEX_STRUCT.size + 1,
+                         INDEX_STRUCT.size)]
+        self.times = [record[0] for record in records]
+        self.offsets = [record[1] for record in records]
+        self.first_time = self.times[0] if self.times else None
+
+        self.configs = []
+        with open(path + CONFIGS_EXT, 'rb') as file:
+            configs = file.read()
+        pos = 0
+        while pos + OFFSET_STRUCT.size + 4 <= len(configs):
+            offset = OFFSET_STRUCT.unpack_from(configs, pos)[0]
+            pos += OFFSET_STRUCT.size
+            size = (configs[pos+2] << 8) | configs[pos+3]
+            self.configs.append((offset, configs[pos:pos+size]))
+            pos += size
+
+        self.file = None
+        self.map = None
+        self.view = None
+
+    def open(self):
+        """ Map segment into memory. """
+        self.file = open(self.path + SEGMENT_EXT, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        if size:
+            self.map = mmap.mmap(self.file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+            self.view = memoryview(self.map)
+        else:
+            self.view = memoryview(b'')
+
+    def close(self):
+        """ Unmap segment. Views of frames must be released before. """
+        if self.file is None:
+            return
+        self.view.release()
+        self.view = None
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                pass  # frames are still used, unmapped by collector
+            self.map = None
+        self.file.close()
+        self.file = None
+
+    def start_offset(self, time_ns):
+        """ Return offset of frame before which all frames are older
+        than time_ns. """
+        pos = bisect.bisect_left(self.times, time_ns) - 1
+        return self.offsets[pos] if pos >= 0 else 0
+
+
+class CaptureReader:
+    """ Reader of frames recorded by :class:`CaptureRecorder`.
+
+    Segments are mapped into memory (mmap) and frames are returned as
+    views of the mapping, so nothing is copied and files are never read
+    as a whole. The views are valid until the reader goes to the next
+    segment. The start of reading is found by binary search in the time
+    index.
+
+    :param directory: Directory of segment files
+    :type directory: str
+    :param prefix: Prefix of names of segment files
+    :type prefix: str
+    """
+    def __init__(self, directory, prefix="capture"):
+        pattern = os.path.join(glob.escape(directory),
+                               glob.escape(prefix) + "-*" + SEGMENT_EXT)
+        paths = sorted(path[:-len(SEGMENT_EXT)] for path in glob.glob(pattern))
+        self.segments = [CaptureSegment(path) for path in paths]
+        self.__configs = {}
+
+    def frames(self, start_ns=None, end_ns=None):
+        """ Generator of frames recorded in time range.
+
+        :param start_ns: Start time (nanoseconds), None means from the
+            beginning
+        :type start_ns: int
+        :param end_ns: End time (nanoseconds, inclusive), None means up
+            to the end
+        :type end_ns: int
+
+        :return: Generator of tuples (frame memoryview, config frame of
+            the data source or None if it is unknown)
+        """
+        for _, _, frame, config_frame in self.__frames(start_ns, end_ns):
+            if frame is not None:
+                yield frame, config_frame
+
+    def data_frames(self, start_ns=None, end_ns=None):
+        """ Generator of parsed data frames recorded in time range (see
+        :meth:`frames`). Data frames of unknown configuration are
+        skipped.
+
+        :rtype: generator of :class:`espmu.pmuDataFrame.DataFrame`
+        """
+        for frame, config_frame in self.frames(start_ns, end_ns):
+            if (frame[1] >> 4) & 7 == FrameType.Data.value and \
+               config_frame is not None:
+                yield DataFrame.fromBytes(frame, config_frame)
+
+    def batches(self, start_ns=None, end_ns=None, max_num=None):
+        """ Generator of data frames decoded by batch decoder (NumPy is
+        required). Consecutive data frames of the same configuration are
+        decoded at once directly from the mapping.
+
+        :param max_num: Max number of frames in batch
+        :type max_num: int
+
+        :rtype: generator of :class:`espmu.batch.BatchData`
+        """
+        from espmu.batch import decode_frames
+
+        run_view = None
+        run_start = run_end = 0
+        run_config = None
+        run_num = 0
+        for view, offset, frame, config_frame in \
+                self.__frames(start_ns, end_ns):
+            is_data = frame is not None and \
+                (frame[1] >> 4) & 7 == FrameType.Data.value and \
+                config_frame is not None
+            if run_num and (not is_data or view is not run_view or
+                            offset != run_end or
+                            config_frame is not run_config or
+                            run_num == max_num):
+                yield decode_frames(run_view[run_start:run_end], run_config)
+                run_num = 0
+            if not is_data:
+                continue
+            if not run_num:
+                run_view = view
+                run_start = offset
+                run_config = config_frame
+            run_end = offset + len(frame)
+            run_num += 1
+        if run_num:
+            yield decode_frames(run_view[run_start:run_end], run_config)
+
+    def __frames(self, start_ns, end_ns):
+        current = {}
+        time_bases = {}
+        for segment in self.segments[self.__first_segment(start_ns):]:
+            offset = 0 if start_ns is None else \
+                segment.start_offset(start_ns)
+            for config_offset, frame in segment.configs:
+                if config_offset <= offset:
+                    self.__set_config(current, time_bases, frame)
+            segment.open()
+            try:
+                for offset, frame in self.__walk(segment.view, offset):
+                    idcode = (frame[4] << 8) | frame[5]
+                    if (frame[1] >> 4) & 7 in CONFIG_FRAME_TYPES:
+                        self.__set_config(current, time_bases, frame)
+                    if start_ns is not None or end_ns is not None:
+                        time_ns = frame_time_ns(frame, time_bases.get(idcode))
+                        if start_ns is not None and time_ns < start_ns:
+                            continue
+                        if end_ns is not None and time_ns > end_ns:
+                            yield segment.view, None, None, None
+                            return
+                    yield segment.view, offset, frame, current.get(idcode)
+                # the end of segment, views of it will be released
+                yield segment.view, None, None, None
+            finally:
+                segment.close()
+
+    def __first_segment(self, start_ns):
+        if start_ns is None:
+            return 0
+        # segments without time index (only configs) are kept in the
+        # search, so the result is the index in self.segments
+        first = 0
+        for ind, segment in enumerate(self.segments):
+            if segment.first_time is None:
+                continue
+            if segment.first_time >= start_ns:
+                break
+            first = ind
+        return first
+
+    def __set_config(self, current, time_bases, frame):
+        idcode = (frame[4] << 8) | frame[5]
+        key = bytes(frame[14:-2])
+        config_frame = self.__configs.get(key)
+        if config_frame is None:
+            config_frame = ConfigFrame.fromBytes(bytes(frame))
+            self.__configs[key] = config_frame
+        current[idcode] = config_frame
+        time_bases[idcode] = config_frame.time_base.baseDecStr
+
+    @staticmethod
+    def __walk(view, offset):
+        size = len(view)
+        while offset + 4 <= size and view[offset] == SYNC_BYTE:
+            framesize = (view[offset+2] << 8) | view[offset+3]
+            if framesize < MIN_FRAME_SIZE or offset + framesize > size:
+                return  # truncated at the end of capture
+            yield offset, view[offset:offset+framesize]
+            offset += framesize
@@ -2,6 +2,8 @@
 
 import socket
 
+from espmu.framer import MAX_FRAME_SIZE, SYNC_BYTE, Framer
+
 
 class Client:
     """
@@ -34,6 +36,14 @@ class Client:
         self.useUdp = False
         self.unixSock = False
 
+        self.__frameBuf = bytearray(MAX_FRAME_SIZE)
+        self.__frameView = memoryview(self.__frameBuf)
+        self.__bodyView = self.__frameView[4:]
+        self.__frameViews = {}
+        self.__frameFill = 0
+        self.__framer = None
+        self.recorder = None
+
         self.destIp = theDestIp
         self.destPort = theDestPort
         self.destAddr = (theDestIp, theDestPort)
@@ -92,6 +102,89 @@ class Client:
             print("Socket Timeout")
             return ""
 
+    def readFrame(self):
+        """
+        Read exactly one frame from the socket. The header is read
+        first, then exactly FRAMESIZE bytes are read into the buffer
+        reused between calls, so nothing is allocated per frame in
+        steady state. Partial reads are continued by the next call
+        after timeout. For UDP the whole datagram is returned.
+
+        :return: Memoryview of frame bytes which is valid until the
+            next call, or None if socket timed out
+
+        :raises ConnectionError: If connection is closed by peer
+        :raises ValueError: If the stream is not synchronized
+        """
+        try:
+            if self.useUdp:
+                size = self.theSocket.recv_into(self.__frameBuf)
+                if self.recorder is not None:
+                    self.recorder.write(self.__frameView[:size])
+                return self.__frameView[:size]
+            self.__fillFrame(4)
+            framesize = (self.__frameBuf[2] << 8) | self.__frameBuf[3]
+            if self.__frameBuf[0] != SYNC_BYTE or framesize < 4:
+                self.__frameFill = 0
+                raise ValueError("Stream is not synchronized")
+            self.__fillFrame(framesize)
+        except socket.timeout:
+            return None
+
+        self.__frameFill = 0
+        view = self.__frameViews.get(framesize)
+        if view is None:
+            view = self.__frameView[:framesize]
+            self.__frameViews[framesize] = view
+        if self.recorder is not None:
+            self.recorder.write(view)
+        return view
+
+    def __fillFrame(self, size):
+        while self.__frameFill < size:
+            if self.__frameFill == 4:
+                view = self.__bodyView
+            else:
+                view = self.__frameView[self.__frameFill:]
+            received = self.theSocket.recv_into(view, size - self.__frameFill)
+            if not received:
+                self.__frameFill = 0
+                raise ConnectionError("Connection is closed")
+            self.__frameFill += received
+
+    def readFrames(self):
+        """
+        Receive available bytes and return all complete frames. Bytes
+        of incomplete frame are kept until the next call. Frames of all
+        types are returned, garbage between frames is skipped.
+
+        :return: List of frames (bytes), empty if socket timed out
+
+        :raises ConnectionError: If connection is closed by peer
+        """
+        if self.__framer is None:
+            self.__framer = Framer()
+        try:
+            received = self.theSocket.recv_into(self.__framer.recv_buffer())
+        except socket.timeout:
+            return []
+        if not received:
+            raise ConnectionError("Connection is closed")
+        frames = self.__framer.received(received)
+        if self.recorder is not None:
+            self.recorder.write_frames(frames)
+        return frames
+
+    def setRecorder(self, recorder):
+        """Record every frame read by :meth:`readFrame` and
+        :meth:`readFrames` (and config frame read by
+        :func:`espmu.tools.readConfigFrame2`)
+
+        :param recorder: Recorder or None to stop recording
+        :type recorder: :class:`espmu.capture.CaptureRecorder`
+        """
+        self.recorder = recorder
+
     def sendData(self, bytes_to_send):
         """Send bytes to destination
 
@@ -0,0 +1,173 @@
+""" In this module the lossless codec of PMU time series is implemented.
+NumPy is required for this module.
+
+Every column is encoded by the method suited to its values:
+
+* timestamps -- delta-of-delta, which is zero for steady data rate
+* floating values (freq, dfreq, magnitudes, angles, analogs) -- XOR of
+  the bits of the value with the bits of the previous one, so the
+  slowly changing values produce many zero bits
+* STAT words -- run-length encoding
+
+The result of the first two methods is byte-shuffled (the first bytes
+of all values, then the second ones and so on) and compressed by zlib.
+Encoding and decoding are vectorized, there are no loops over values.
+
+Encoded column starts with header: method, type code of values, number
+of values. """
+
+import struct
+import zlib
+
+import numpy as np
+
+TIMES = 1
+FLOATS = 2
+RLE = 3
+
+HEADER_STRUCT = struct.Struct('<BcQ')
+LEVEL = 6
+
+
+def _shuffle(values):
+    return values.view(np.uint8).reshape(
+        len(values), values.dtype.itemsize).T.tobytes()
+
+
+def _unshuffle(data, dtype, count):
+    dtype = np.dtype(dtype)
+    raw = np.frombuffer(data, np.uint8).reshape(dtype.itemsize, count)
+    return np.ascontiguousarray(raw.T).view(dtype).reshape(count)
+
+
+def encode_times(time_ns, level=LEVEL):
+    """ Encode timestamps (int64) as delta-of-delta.
+
+    :param time_ns: Timestamps
+    :type time_ns: numpy.ndarray
+    :return: Encoded bytes (without header)
+    """
+    values = np.asarray(time_ns, dtype='<i8')
+    dod = np.empty_like(values)
+    dod[:2] = values[:2]
+    if len(values) > 1:
+        dod[1] = values[1] - values[0]
+        dod[2:] = np.diff(values, 2)
+    zigzag = (dod << 1) ^ (dod >> 63)
+    return zlib.compress(_shuffle(zigzag), level)
+
+
+def decode_times(data, count):
+    """ Decode timestamps encoded by :func:`encode_times`. """
+    zigzag = _unshuffle(zlib.decompress(data), '<u8', count)
+    dod = ((zigzag >> np.uint64(1)) ^
+           (np.uint64(0) - (zigzag & np.uint64(1)))).view('<i8')
+    if count < 2:
+        return dod.copy()
+    deltas = np.cumsum(dod[1:])
+    return np.concatenate((dod[:1], dod[0] + np.cumsum(deltas)))
+
+
+def encode_floats(values, level=LEVEL):
+    """ Encode floating values XOR-ing each one with the previous.
+
+    :param values: Values (float32 or float64)
+    :type values: numpy.ndarray
+    :return: Encoded bytes (without header)
+    """
+    values = np.asarray(values)
+    bits = values.astype(values.dtype.newbyteorder('<')).view(
+        '<u{}'.format(values.dtype.itemsize))
+    xored = bits.copy()
+    xored[1:] ^= bits[:-1]
+    return zlib.compress(_shuffle(xored), level)
+
+
+def decode_floats(data, dtype, count):
+    """ Decode values encoded by :func:`encode_floats`. """
+    dtype = np.dtype(dtype).newbyteorder('<')
+    xored = _unshuffle(zlib.decompress(data),
+                       '<u{}'.format(dtype.itemsize), count)
+    return np.bitwise_xor.accumulate(xored).view(dtype)
+
+
+def encode_rle(values, level=LEVEL):
+    """ Encode integer values (STAT words) as runs.
+
+    :param values: Values
+    :type values: numpy.ndarray
+    :return: Encoded bytes (without header)
+    """
+    values = np.asarray(values)
+    starts = np.flatnonzero(np.diff(values)) + 1
+    if len(values):
+        starts = np.concatenate(([0], starts))
+    lengths = np.diff(np.append(starts, len(values))).astype('<u4')
+    run_values = values[starts].astype(values.dtype.newbyteorder('<'))
+    return zlib.compress(
+        struct.pack('<I', len(starts)) + run_values.tobytes() +
+        lengths.tobytes(), level)
+
+
+def decode_rle(data, dtype, count):
+    """ Decode values encoded by :func:`encode_rle`. """
+    dtype = np.dtype(dtype).newbyteorder('<')
+    raw = zlib.decompress(data)
+    runs = struct.unpack_from('<I', raw)[0]
+    run_values = np.frombuffer(raw, dtype, runs, 4)
+    lengths = np.frombuffer(raw, '<u4', runs, 4 + runs * dtype.itemsize)
+    res = np.repeat(run_values, lengths)
+    if len(res) != count:
+        raise ValueError("Wrong number of values in runs")
+    return res
+
+
+def encode_column(values, method=None, level=LEVEL):
+    """ Encode column with header. By default the method is chosen by
+    type of values: int64 -- timestamps, floating -- XOR, other integer
+    types -- run-length.
+
+    :param values: One-dimensional array
+    :type values: numpy.ndarray
+    :param method: TIMES, FLOATS or RLE
+    :type method: int
+    :return: Encoded bytes
+    """
+    values = np.asarray(values)
+    if method is None:
+        if values.dtype.kind == 'f':
+            method = FLOATS
+        elif values.dtype.itemsize == 8:
+            method = TIMES
+        else:
+            method = RLE
+    if method == TIMES:
+        payload = encode_times(values, level)
+    elif method == FLOATS:
+        payload = encode_floats(values, level)
+    elif method == RLE:
+        payload = encode_rle(values, level)
+    else:
+        raise ValueError("Unknown method {}".format(method))
+    header = HEADER_STRUCT.pack(method, values.dtype.char.encode(),
+                                len(values))
+    return header + payload
+
+
+def decode_column(data):
+    """ Decode column encoded by :func:`encode_column`.
+
+    :param data: Encoded bytes
+    :type data: bytes
+    :return: Array of values
+    """
+    method, type_code, count = HEADER_STRUCT.unpack_from(data)
+    dtype = np.dtype(type_code.decode())
+    payload = memoryview(data)[HEADER_STRUCT.size:]
+    if method == TIMES:
+        return decode_times(payload, count).astype(dtype)
+    if method == FLOATS:
+        return decode_floats(payload, dtype, count)
+    if method == RLE:
+        return decode_rle(payload, dtype, count)
+    raise ValueError("Unknown method {}".format(method))
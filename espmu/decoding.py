@@ -0,0 +1,329 @@
+""" In this module the decode plan for data frames is implemented.
+The layout of data frames is fully determined by the config frame, so
+the plan is built once per config frame and then is used for decoding
+each data frame with single unpack call. """
+
+import math
+import struct
+from collections import namedtuple
+
+from espmu.pmuFrame import HEADER_STRUCT, CHK_STRUCT, NS_IN_SEC
+
+HEADER_FIELDS_NUM = 5
+
+
+def _field_formats(station):
+    """ Return struct formats of phasor, FREQ with DFREQ and analog
+    value of station. """
+    phsr = 'hh' if station.phsrType == "INTEGER" else 'ff'
+    freq = 'hh' if station.freqType == "INTEGER" else 'ff'
+    anlg = 'h' if station.anlgType == "INTEGER" else 'f'
+    return phsr, freq, anlg
+
+
+def station_format(station):
+    """ Return struct format (without byte order) of station fields in
+    data frame.
+
+    :param station: Station from config frame
+    :type station: Station
+    """
+    phsr, freq, anlg = _field_formats(station)
+    return 'H' + phsr*station.phnmr + freq + anlg*station.annmr + \
+        'H'*station.dgnmr
+
+
+def config_key(config_frame):
+    """ Return the value which changes when the layout of data frames
+    can change. """
+    return tuple(station.cfgcnt for station in config_frame.stations)
+
+
+class StationPlan:
+    """ Positions of station fields in data frame.
+
+    Indexes point to the tuple unpacked by :class:`DecodePlan`,
+    offsets are counted in bytes from the beginning of data frame.
+
+    :param station: Station from config frame
+    :type station: Station
+    :param index: Index of station STAT field in unpacked tuple
+    :type index: int
+    :param offset: Offset of station fields in data frame
+    :type offset: int
+    """
+    def __init__(self, station, index, offset):
+        self.station = station
+        self.format = station_format(station)
+        self.offset = offset
+        self.size = struct.calcsize('!' + self.format)
+
+        self.stat = index
+        self.phasors = index + 1
+        self.freq = self.phasors + 2*station.phnmr
+        self.analogs = self.freq + 2
+        self.digitals = self.analogs + station.annmr
+        self.end = self.digitals + station.dgnmr
+
+        phsr, freq, anlg = _field_formats(station)
+        self.phasor_struct = struct.Struct('!' + phsr)
+        self.freq_struct = struct.Struct('!' + freq)
+        self.analogs_struct = struct.Struct('!' + anlg*station.annmr)
+        self.digitals_struct = struct.Struct('!' + 'H'*station.dgnmr)
+
+    def phasor_offset(self, ind):
+        """ Return offset of phasor in data frame. """
+        return self.offset + 2 + ind*self.phasor_struct.size
+
+    def freq_offset(self):
+        """ Return offset of FREQ (followed by DFREQ) in data frame. """
+        return self.phasor_offset(self.station.phnmr)
+
+    def analogs_offset(self):
+        """ Return offset of analog values in data frame. """
+        return self.freq_offset() + self.freq_struct.size
+
+    def digitals_offset(self):
+        """ Return offset of digital words in data frame. """
+        return self.analogs_offset() + self.analogs_struct.size
+
+
+class DecodePlan:
+    """ Precompiled layout of data frames described by config frame.
+
+    :param config_frame: Config frame
+    :type config_frame: ConfigFrame
+    """
+    def __init__(self, config_frame):
+        self.key = config_key(config_frame)
+        self.stations = []
+
+        fmt = HEADER_STRUCT.format
+        index = HEADER_FIELDS_NUM
+        offset = HEADER_STRUCT.size
+        for station in config_frame.stations:
+            station_plan = StationPlan(station, index, offset)
+            self.stations.append(station_plan)
+            fmt += station_plan.format
+            index = station_plan.end
+            offset += station_plan.size
+        fmt += CHK_STRUCT.format[1:]
+
+        self.struct = struct.Struct(fmt)
+        self.framesize = self.struct.size
+
+    @classmethod
+    def for_config(cls, config_frame):
+        """ Return decode plan for config frame. The plan is built once
+        and is stored in config frame. It is rebuilt if CFGCNT of any
+        station changes.
+
+        :param config_frame: Config frame
+        :type config_frame: ConfigFrame
+        """
+        plan = getattr(config_frame, 'decodePlan', None)
+        if plan is None or plan.key != config_key(config_frame):
+            plan = cls(config_frame)
+            config_frame.decodePlan = plan
+        return plan
+
+    def unpack(self, frame_bytes, offset=0):
+        """ Unpack all fields of data frame.
+
+        :param frame_bytes: Buffer containing data frame
+        :type frame_bytes: bytes/bytearray/memoryview
+        :param offset: Position of data frame in the buffer
+        :type offset: int
+
+        :return: Tuple of values
+        """
+        framesize = struct.unpack_from('!H', frame_bytes, offset + 2)[0]
+        if framesize != self.framesize:
+            raise ValueError(
+                "Data frame size {} does not match config frame ({})".format(
+                    framesize, self.framesize))
+        return self.struct.unpack_from(frame_bytes, offset)
+
+
+ProjectedFrame = namedtuple('ProjectedFrame', [
+    'utcNs', 'utcSec', 'stations'
+])
+ProjectedFrame.__doc__ = """ Data frame decoded with projection. """
+
+ProjectedStation = namedtuple('ProjectedStation', [
+    'index', 'stat', 'freq', 'dfreq', 'phasors', 'analogs'
+])
+ProjectedStation.__doc__ = """ Selected fields of station. Phasors are
+(magnitude, angle in radians) pairs, analogs are values, both in the
+order of selection. """
+
+
+def find_index(names, key):
+    """ Return index of name in list. Names are compared ignoring
+    spaces (names of stations and channels are padded in config frame).
+
+    :param names: List of names
+    :type names: list
+    :param key: Name or index
+    :type key: str/int
+
+    :raises IndexError: If index is out of range
+    :raises KeyError: If there is no such name
+    """
+    if isinstance(key, int):
+        if not 0 <= key < len(names):
+            raise IndexError("Index {} is out of range".format(key))
+        return key
+    key = key.replace(" ", "")
+    for i, name in enumerate(names):
+        if name.replace(" ", "") == key:
+            return i
+    raise KeyError(key)
+
+
+class _StationProjection:
+    def __init__(self, station_plan, index, channels):
+        station = station_plan.station
+        self.index = index
+        self.phasors = []
+        self.analogs = []
+        if channels is None:
+            self.phasors = list(range(station.phnmr))
+            self.analogs = list(range(station.annmr))
+        for channel in channels or []:
+            ind = find_index(station.ph_channels + station.an_channels,
+                             channel)
+            if ind < station.phnmr:
+                self.phasors.append(ind)
+            else:
+                self.analogs.append(ind - station.phnmr)
+        self.rect = station.phsrFmt == "RECT"
+        self.ang_div = 10000 if station.phsrType == "INTEGER" else 1
+
+        # positions of values in the unpacked tuple, set by Projection
+        self.stat = None
+        self.freq = None
+        self.phasor_pos = {}
+        self.analog_pos = {}
+
+    def decode(self, values):
+        freq, dfreq = values[self.freq], values[self.freq+1]
+        phasors = []
+        for ind in self.phasors:
+            pos = self.phasor_pos[ind]
+            val1, val2 = values[pos], values[pos+1]
+            if self.rect:
+                phasors.append((math.hypot(val1, val2),
+                                math.atan2(val2, val1)))
+            else:
+                phasors.append((val1, val2/self.ang_div))
+        analogs = [values[self.analog_pos[ind]] for ind in self.analogs]
+        return ProjectedStation(self.index, values[self.stat], freq,
+                                dfreq/100, phasors, analogs)
+
+
+class Projection:
+    """ Decoder of selected stations and channels of data frames. The
+    bytes of fields which are not selected are skipped by precompiled
+    struct, the stations after the last selected one are not read at
+    all.
+
+    STAT, FREQ and DFREQ are always decoded for selected stations.
+
+    :param config_frame: Config frame describing data frames
+    :type config_frame: ConfigFrame
+    :param selection: Mapping from station (name or index) to the list
+        of phasor and analog channels (names or indexes in the list of
+        phasors followed by analogs). None instead of list selects all
+        channels of the station.
+    :type selection: dict
+
+    :raises KeyError: If station or channel name is unknown
+    """
+    def __init__(self, config_frame, selection):
+        self.plan = DecodePlan.for_config(config_frame)
+        self.time_base = config_frame.time_base.baseDecStr
+
+        names = [station.stn for station in config_frame.stations]
+        selected = {}
+        for station_key, channels in selection.items():
+            ind = find_index(names, station_key)
+            selected[ind] = _StationProjection(
+                self.plan.stations[ind], ind, channels)
+        self.stations = [selected[ind] for ind in sorted(selected)]
+
+        self.struct = struct.Struct(self.__build_format())
+
+    def __build_format(self):
+        selected = {proj.index: proj for proj in self.stations}
+        fmt = '!2xH2xII'
+        pos = 3
+        skip = 0
+        for ind, station_plan in enumerate(self.plan.stations):
+            proj = selected.get(ind)
+            if proj is None:
+                skip += station_plan.size
+                continue
+
+            station = station_plan.station
+            phsr = station_plan.phasor_struct.format[1:]
+            freq = station_plan.freq_struct.format[1:]
+            anlg = 'h' if station.anlgType == "INTEGER" else 'f'
+            anlg_size = struct.calcsize(anlg)
+
+            fmt += _skip(skip) + 'H'
+            skip = 0
+            proj.stat = pos
+            pos += 1
+
+            for i in range(station.phnmr):
+                if i in proj.phasors:
+                    fmt += _skip(skip) + phsr
+                    skip = 0
+                    proj.phasor_pos[i] = pos
+                    pos += 2
+                else:
+                    skip += station_plan.phasor_struct.size
+
+            fmt += _skip(skip) + freq
+            skip = 0
+            proj.freq = pos
+            pos += 2
+
+            for i in range(station.annmr):
+                if i in proj.analogs:
+                    fmt += _skip(skip) + anlg
+                    skip = 0
+                    proj.analog_pos[i] = pos
+                    pos += 1
+                else:
+                    skip += anlg_size
+
+            skip += 2*station.dgnmr
+        return fmt
+
+    def decode(self, frame_bytes, offset=0):
+        """ Decode selected fields of data frame.
+
+        :param frame_bytes: Buffer containing data frame
+        :type frame_bytes: bytes/bytearray/memoryview
+        :param offset: Position of data frame in the buffer
+        :type offset: int
+
+        :rtype: ProjectedFrame
+        """
+        values = self.struct.unpack_from(frame_bytes, offset)
+        if values[0] != self.plan.framesize:
+            raise ValueError(
+                "Data frame size {} does not match config frame ({})".format(
+                    values[0], self.plan.framesize))
+        soc, fracsec = values[1], values[2] & 0xFFFFFF
+        return ProjectedFrame(
+            soc*NS_IN_SEC + fracsec*NS_IN_SEC // self.time_base,
+            soc + fracsec / self.time_base,
+            [proj.decode(values) for proj in self.stations]
+        )
+
+
+def _skip(size):
+    return '{}x'.format(size) if size else ''
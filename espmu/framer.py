@@ -0,0 +1,123 @@
+""" In this module the framer of C37.118 byte stream is implemented.
+Chunks of bytes of arbitrary size are fed into the framer, and it
+returns every complete frame (data, config, header or command) found
+so far, keeping the partial tail until the next chunk. """
+
+SYNC_BYTE = 0xAA
+MIN_FRAME_SIZE = 16
+MAX_FRAME_SIZE = 65535
+MAX_FRAME_TYPE = 5
+DEFAULT_CHUNK_SIZE = 65536
+
+
+class Framer:
+    """ Splitter of byte stream into frames.
+
+    Unread bytes are kept in a buffer which is compacted when free
+    space is exhausted and grows if it is not enough. After garbage
+    in the stream the framer resynchronizes on the next sync byte.
+
+    :param size: Initial size of buffer
+    :type size: int
+    """
+    def __init__(self, size=2*MAX_FRAME_SIZE):
+        self.__buf = bytearray(size)
+        self.__start = 0
+        self.__end = 0
+
+        self.frames_num = 0
+        self.skipped_num = 0
+
+    def pending(self):
+        """ Return number of bytes of incomplete frame. """
+        return self.__end - self.__start
+
+    def reset(self):
+        """ Drop unread bytes. """
+        self.__start = 0
+        self.__end = 0
+
+    def feed(self, chunk):
+        """ Add chunk of bytes and return complete frames.
+
+        :param chunk: Bytes received from the stream
+        :type chunk: bytes/bytearray/memoryview
+
+        :return: List of frames (bytes)
+        """
+        size = len(chunk)
+        self.__reserve(size)
+        self.__buf[self.__end:self.__end+size] = chunk
+        return self.received(size)
+
+    def recv_buffer(self, size=DEFAULT_CHUNK_SIZE):
+        """ Return writable memoryview of free space of the buffer for
+        reading from socket directly (``recv_into``). After reading
+        :meth:`received` must be called.
+
+        :param size: Minimal size of free space
+        :type size: int
+        """
+        self.__reserve(size)
+        return memoryview(self.__buf)[self.__end:]
+
+    def received(self, size):
+        """ Commit bytes written to the buffer returned by
+        :meth:`recv_buffer` and return complete frames.
+
+        :param size: Number of written bytes
+        :type size: int
+
+        :return: List of frames (bytes)
+        """
+        self.__end += size
+        frames = []
+        while True:
+            frame = self.__next_frame()
+            if frame is None:
+                break
+            frames.append(frame)
+        if self.__start == self.__end:
+            self.__start = 0
+            self.__end = 0
+        return frames
+
+    def __next_frame(self):
+        buf = self.__buf
+        while self.__end - self.__start >= 4:
+            start = self.__start
+            if buf[start] != SYNC_BYTE:
+                self.__resync(start)
+                continue
+            framesize = (buf[start+2] << 8) | buf[start+3]
+            if buf[start+1] & 0x80 or \
+               (buf[start+1] >> 4) > MAX_FRAME_TYPE or \
+               framesize < MIN_FRAME_SIZE:
+                self.__resync(start + 1)
+                continue
+            if self.__end - start < framesize:
+                return None
+            self.__start = start + framesize
+            self.frames_num += 1
+            return bytes(buf[start:self.__start])
+        return None
+
+    def __resync(self, pos):
+        found = self.__buf.find(SYNC_BYTE, pos, self.__end)
+        if found < 0:
+            found = self.__end
+        self.skipped_num += found - self.__start
+        self.__start = found
+
+    def __reserve(self, size):
+        if len(self.__buf) - self.__end >= size:
+            return
+        pending = self.__end - self.__start
+        if len(self.__buf) - pending < size:
+            new_buf = bytearray(max(2*len(self.__buf), pending + size))
+            new_buf[:pending] = self.__buf[self.__start:self.__end]
+            self.__buf = new_buf
+        else:
+            self.__buf[:pending] = self.__buf[self.__start:self.__end]
+        self.__start = 0
+        self.__end = pending
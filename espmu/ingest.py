@@ -0,0 +1,226 @@
+""" This module implements single-threaded ingestion engine which reads
+data from many PMUs or PDCs at once. Sockets are non-blocking and
+multiplexed by :mod:`selectors`, the handshake (DATAOFF, CONFIG2,
+DATAON) of every stream is made without blocking the others. """
+
+import errno
+import selectors
+import socket
+import time
+
+from espmu import tools as pt
+from espmu.client import Client
+from espmu.framer import Framer
+from espmu.pmuConfigFrame import ConfigFrame
+from espmu.pmuEnum import FrameType
+
+CONNECTING = "CONNECTING"
+WAIT_CONFIG = "WAIT_CONFIG"
+STREAMING = "STREAMING"
+CLOSED = "CLOSED"
+
+CONFIG_FRAME_TYPES = (FrameType.Config1.value, FrameType.Config2.value,
+                      FrameType.Config3.value)
+
+
+class Stream:
+    """ Stream of one PMU or PDC handled by :class:`IngestionEngine`.
+
+    :param ip_addr: IP address of data source
+    :type ip_addr: str
+    :param tcp_port: TCP port of data source
+    :type tcp_port: int
+    :param idcode: Frame ID of data source
+    :type idcode: int
+    :param callback: Function called as ``callback(stream, frame)`` for
+        every data frame (bytes), use :attr:`conf_frame` to decode it
+    :type callback: callable
+    """
+    def __init__(self, ip_addr, tcp_port, idcode, callback):
+        self.ip_addr = ip_addr
+        self.tcp_port = tcp_port
+        self.idcode = idcode
+        self.callback = callback
+
+        self.state = CONNECTING
+        self.conf_frame = None
+        self.error = None
+        self.client = Client(ip_addr, tcp_port, proto="TCP")
+        self.framer = Framer()
+
+        self.frames_num = 0
+        self.bytes_num = 0
+        self.config_requests = 0
+        self.deadline = None
+        self.__stat_time = time.monotonic()
+        self.__stat_frames = 0
+        self.__stat_bytes = 0
+
+    def throughput(self):
+        """ Return (frames per second, bytes per second) since the
+        previous call. """
+        now = time.monotonic()
+        period = max(now - self.__stat_time, 1e-9)
+        res = ((self.frames_num - self.__stat_frames) / period,
+               (self.bytes_num - self.__stat_bytes) / period)
+        self.__stat_time = now
+        self.__stat_frames = self.frames_num
+        self.__stat_bytes = self.bytes_num
+        return res
+
+
+class IngestionEngine:
+    """ Engine reading many streams in single thread.
+
+    :param timeout: Time (seconds) to wait for connection and for config
+        frame after CONFIG2 request
+    :type timeout: float
+    :param config_attempts: Number of CONFIG2 requests before the
+        stream is closed
+    :type config_attempts: int
+    """
+    def __init__(self, timeout=5, config_attempts=3):
+        self.timeout = timeout
+        self.config_attempts = config_attempts
+        self.streams = []
+        self.__selector = selectors.DefaultSelector()
+        self.__running = False
+
+    def add_stream(self, ip_addr, tcp_port, idcode, callback):
+        """ Start connecting to data source.
+
+        :return: Added stream
+        :rtype: Stream
+        """
+        stream = Stream(ip_addr, tcp_port, idcode, callback)
+        sock = stream.client.theSocket
+        sock.setblocking(False)
+        code = sock.connect_ex(stream.client.destAddr)
+        if code not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            stream.error = OSError(code, "Connection failed")
+            stream.state = CLOSED
+            stream.client.stop()
+        else:
+            stream.deadline = time.monotonic() + self.timeout
+            self.__selector.register(sock, selectors.EVENT_WRITE, stream)
+        self.streams.append(stream)
+        return stream
+
+    def remove_stream(self, stream):
+        """ Turn data off and close the stream. """
+        if stream.state == STREAMING:
+            try:
+                pt.turnDataOff(stream.client, stream.idcode)
+            except OSError:
+                pass
+        self.__close(stream)
+        self.streams.remove(stream)
+
+    def report(self):
+        """ Return throughput of streams as list of tuples
+        (stream, state, frames per second, bytes per second). """
+        return [(stream, stream.state) + stream.throughput()
+                for stream in self.streams]
+
+    def run_once(self, timeout=1.0):
+        """ Wait for events at most timeout seconds and handle them. """
+        if self.__selector.get_map():
+            events = self.__selector.select(timeout)
+        else:
+            time.sleep(timeout)
+            events = []
+        for key, mask in events:
+            stream = key.data
+            try:
+                if mask & selectors.EVENT_WRITE:
+                    self.__on_connected(stream)
+                else:
+                    self.__on_readable(stream)
+            except (OSError, ValueError) as exc:
+                stream.error = exc
+                self.__close(stream)
+        self.__check_deadlines()
+
+    def run(self):
+        """ Handle events until :meth:`stop` is called. """
+        self.__running = True
+        while self.__running:
+            self.run_once()
+
+    def stop(self):
+        """ Stop :meth:`run` loop. """
+        self.__running = False
+
+    def close(self):
+        """ Remove all streams. """
+        for stream in list(self.streams):
+            self.remove_stream(stream)
+        self.__selector.close()
+
+    def __on_connected(self, stream):
+        sock = stream.client.theSocket
+        code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if code:
+            raise OSError(code, "Connection failed")
+        self.__selector.modify(sock, selectors.EVENT_READ, stream)
+        pt.turnDataOff(stream.client, stream.idcode)
+        self.__request_config(stream)
+
+    def __request_config(self, stream):
+        if stream.config_requests >= self.config_attempts:
+            raise OSError(errno.ETIMEDOUT, "No config frame")
+        stream.config_requests += 1
+        stream.state = WAIT_CONFIG
+        stream.deadline = time.monotonic() + self.timeout
+        pt.requestConfigFrame2(stream.client, stream.idcode)
+
+    def __on_readable(self, stream):
+        sock = stream.client.theSocket
+        try:
+            received = sock.recv_into(stream.framer.recv_buffer())
+        except BlockingIOError:
+            return
+        if not received:
+            raise ConnectionError("Connection is closed")
+        stream.bytes_num += received
+        for frame in stream.framer.received(received):
+            self.__on_frame(stream, frame)
+
+    def __on_frame(self, stream, frame):
+        ftype = (frame[1] >> 4) & 7
+        if ftype in CONFIG_FRAME_TYPES:
+            stream.conf_frame = ConfigFrame.fromBytes(frame)
+            if stream.state == WAIT_CONFIG:
+                stream.state = STREAMING
+                stream.deadline = None
+                pt.turnDataOn(stream.client, stream.idcode)
+            return
+        if ftype != FrameType.Data.value or stream.state != STREAMING:
+            return
+        stream.frames_num += 1
+        stream.callback(stream, frame)
+
+    def __check_deadlines(self):
+        now = time.monotonic()
+        for stream in self.streams:
+            if stream.deadline is None or stream.deadline > now:
+                continue
+            try:
+                if stream.state == WAIT_CONFIG:
+                    self.__request_config(stream)
+                else:
+                    raise OSError(errno.ETIMEDOUT, "Connection timed out")
+            except OSError as exc:
+                stream.error = exc
+                self.__close(stream)
+
+    def __close(self, stream):
+        if stream.state == CLOSED:
+            return
+        stream.state = CLOSED
+        stream.deadline = None
+        try:
+            self.__selector.unregister(stream.client.theSocket)
+        except (KeyError, ValueError):
+            pass
+        stream.client.stop()
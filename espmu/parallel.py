@@ -0,0 +1,283 @@
+""" In this module the parallel decoding of capture files (see
+:mod:`espmu.capture`) is implemented. NumPy is required for this
+module.
+
+Segments are split into byte ranges of equal size which are decoded by
+pool of worker processes. Ranges are cut without looking at frames, so
+every worker resynchronizes: it starts from the first valid frame
+boundary at or after the start of its range (SYNC byte, sane FRAMESIZE
+and correct CHK at the end of frame) and decodes every frame which
+starts before the end of the range. The same check is used to skip
+garbage inside the range. Config frames of the range
+are taken from the configs file of the segment, so ranges are decoded
+independently. """
+
+import binascii
+import collections
+import multiprocessing
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from espmu.batch import BatchData, frame_dtype, view_frames
+from espmu.capture import (CONFIG_FRAME_TYPES, SEGMENT_EXT, CaptureReader,
+                           CaptureSegment)
+from espmu.framer import MAX_FRAME_TYPE, MIN_FRAME_SIZE, SYNC_BYTE
+from espmu.pmuConfigFrame import ConfigFrame
+from espmu.pmuEnum import FrameType
+from espmu.store import CHUNK_DURATION, ColumnStoreWriter
+
+RANGE_SIZE = 64 * 1024**2
+DATA_FRAME_TYPE = FrameType.Data.value
+CHECK_BLOCK_SIZE = 4096
+
+_configs = {}
+
+
+def _frame_size(data, pos):
+    """ Return size of frame at pos or 0 if there is no sane header. """
+    if pos + 4 > len(data) or data[pos] != SYNC_BYTE or \
+       data[pos+1] & 0x80 or (data[pos+1] >> 4) > MAX_FRAME_TYPE:
+        return 0
+    framesize = (data[pos+2] << 8) | data[pos+3]
+    return framesize if framesize >= MIN_FRAME_SIZE else 0
+
+
+def _is_frame(data, pos):
+    """ Check header and CHK (CRC-CCITT) of frame at pos. """
+    framesize = _frame_size(data, pos)
+    if not framesize or pos + framesize > len(data):
+        return False
+    chk = struct.unpack_from('!H', data, pos + framesize - 2)[0]
+    return binascii.crc_hqx(data[pos:pos+framesize-2], 0xFFFF) == chk
+
+
+def find_frame_start(data, pos, end=None):
+    """ Find the first frame boundary in byte range: SYNC byte followed
+    by sane header, and CHK at the end of frame (by FRAMESIZE) is
+    correct.
+
+    :param data: Bytes of stream of frames
+    :type data: bytes/mmap
+    :param pos: Start of range
+    :type pos: int
+    :param end: End of range, None means the end of data
+    :type end: int
+
+    :return: Offset of frame or None if no frame starts in range
+    """
+    if end is None:
+        end = len(data)
+    while pos < end:
+        pos = data.find(bytes((SYNC_BYTE,)), pos, end)
+        if pos < 0:
+            return None
+        if _is_frame(data, pos):
+            return pos
+        pos += 1
+    return None
+
+
+def _same_frames_num(raw, pos, framesize, end):
+    """ Return number of consecutive frames at pos with the same header
+    (type, size and IDCODE) as the first one, which start before end
+    and are complete. They are checked by blocks, not frame by frame. """
+    count = min((end - pos - 1) // framesize + 1,
+                (len(raw) - pos) // framesize, CHECK_BLOCK_SIZE)
+    headers = raw[pos:pos+count*framesize].reshape(count, framesize)[:, :6]
+    same = np.all(headers == headers[0], axis=1)
+    return count if same.all() else int(np.argmin(same))
+
+
+def _config_frame(frame):
+    key = bytes(frame[14:-2])
+    config_frame = _configs.get(key)
+    if config_frame is None:
+        config_frame = ConfigFrame.fromBytes(bytes(frame))
+        _configs[key] = config_frame
+    return config_frame
+
+
+def _walk_range(segment, start, end):
+    """ Return dict from config frame to list of runs (bytes) of its
+    data frames which start in byte range of open segment. """
+    data = segment.map
+    pos = find_frame_start(data, start, end)
+    if pos is None:
+        return {}
+    raw = np.frombuffer(data, np.uint8)
+    current = {}
+    for offset, frame in segment.configs:
+        if offset <= pos:
+            config_frame = _config_frame(frame)
+            current[config_frame.idcode] = config_frame
+
+    sizes = {}
+    runs = collections.defaultdict(list)
+    run_start = run_end = pos
+    run_config = None
+    while pos < end:
+        framesize = _frame_size(data, pos)
+        config_frame = None
+        if framesize and pos + framesize <= len(data):
+            idcode = (data[pos+4] << 8) | data[pos+5]
+            frame_type = (data[pos+1] >> 4) & 7
+            if frame_type == DATA_FRAME_TYPE:
+                config_frame = current.get(idcode)
+        if config_frame is not None and config_frame not in sizes:
+            sizes[config_frame] = frame_dtype(config_frame).itemsize
+        if config_frame is not None and \
+           framesize == sizes[config_frame]:
+            framesize *= _same_frames_num(raw, pos, framesize, end)
+        elif not _is_frame(data, pos):
+            # garbage (wrong FRAMESIZE would skip real frames) or
+            # frame truncated at the end of capture
+            pos = find_frame_start(data, pos + 1, end)
+            if pos is None:
+                break
+            continue
+        else:
+            config_frame = None
+            if frame_type in CONFIG_FRAME_TYPES:
+                current[idcode] = _config_frame(
+                    data[pos:pos+framesize])
+        if config_frame is not run_config or pos != run_end:
+            if run_config is not None:
+                runs[run_config].append(data[run_start:run_end])
+            run_start = pos
+            run_config = config_frame
+        pos += framesize
+        run_end = pos
+    if run_config is not None:
+        runs[run_config].append(data[run_start:run_end])
+    del raw  # mapping can not be closed while it is viewed
+    return runs
+
+
+def _decode_range(path, start, end):
+    """ Decode data frames starting in byte range of segment. Frames of
+    every configuration are returned as one batch ordered by time. """
+    segment = CaptureSegment(path)
+    segment.open()
+    try:
+        if segment.map is None:
+            return []
+        runs = _walk_range(segment, start, end)
+    finally:
+        segment.close()
+
+    batches = []
+    for config_frame, parts in runs.items():
+        frames = view_frames(b''.join(parts), config_frame)
+        time_base = config_frame.time_base.baseDecStr
+        order = np.argsort(
+            frames['soc'].astype(np.int64) * time_base +
+            (frames['fracsec'] & 0xFFFFFF), kind='stable')
+        batches.append(BatchData(frames[order], config_frame))
+    batches.sort(key=lambda batch: batch.time_ns[0])
+    return batches
+
+
+def _store_range(path, start, end, directory, chunk_duration, compress,
+                 shard):
+    """ Decode byte range of segment and write it into columnar store
+    as shard. Return number of rows. """
+    rows_num = 0
+    writers = {}
+    for batch in _decode_range(path, start, end):
+        writer = writers.get(batch.config_frame)
+        if writer is None:
+            writer = ColumnStoreWriter(directory, batch.config_frame,
+                                       chunk_duration, compress, shard)
+            writers[batch.config_frame] = writer
+        writer.append(batch)
+        rows_num += len(batch)
+    for writer in writers.values():
+        writer.close()
+    return rows_num
+
+
+class ParallelDecoder:
+    """ Parallel decoder of capture recorded by
+    :class:`espmu.capture.CaptureRecorder`.
+
+    Results of ranges are returned in order of ranges, and rows of every
+    range are ordered by time, so the output is in time order as long as
+    frames were captured in time order within the range size.
+
+    :param directory: Directory of segment files
+    :type directory: str
+    :param prefix: Prefix of names of segment files
+    :type prefix: str
+    :param workers: Number of worker processes, by default number of
+        CPUs
+    :type workers: int
+    :param range_size: Size of byte range (bytes) decoded by one task
+    :type range_size: int
+    """
+    def __init__(self, directory, prefix="capture", workers=None,
+                 range_size=RANGE_SIZE):
+        self.directory = directory
+        self.prefix = prefix
+        self.workers = workers or os.cpu_count()
+        self.range_size = range_size
+        self.segments = CaptureReader(directory, prefix).segments
+
+    def ranges(self):
+        """ Return list of tuples (segment path, start, end) of byte
+        ranges of all segments. """
+        res = []
+        for segment in self.segments:
+            size = os.path.getsize(segment.path + SEGMENT_EXT)
+            for start in range(0, size, self.range_size):
+                res.append((segment.path, start,
+                            min(start + self.range_size, size)))
+        return res
+
+    def batches(self):
+        """ Generator of decoded data frames in order of capture.
+
+        :rtype: generator of :class:`espmu.batch.BatchData`
+        """
+        for batches in self.__run(_decode_range, self.ranges()):
+            yield from batches
+
+    def write_store(self, directory, chunk_duration=CHUNK_DURATION,
+                    compress=False):
+        """ Decode capture into columnar store, every worker writes
+        chunks of its ranges (shards) directly. All data frames must be
+        of the same configuration (see
+        :class:`espmu.store.ColumnStoreWriter`).
+
+        :param directory: Directory of the store
+        :type directory: str
+        :param chunk_duration: Time interval (nanoseconds) of chunk
+        :type chunk_duration: int
+        :param compress: Compress columns by :mod:`espmu.codec`
+        :type compress: bool
+        :return: Number of written rows
+        """
+        configs = [frame for segment in self.segments
+                   for _, frame in segment.configs]
+        if configs:
+            # schema is written once, before workers check it
+            ColumnStoreWriter(directory, _config_frame(configs[0]),
+                              chunk_duration, compress)
+        # every range is the shard with its own names of chunks
+        tasks = [(path, start, end, directory, chunk_duration, compress, ind)
+                 for ind, (path, start, end) in enumerate(self.ranges())]
+        return sum(self.__run(_store_range, tasks))
+
+    def __run(self, func, tasks):
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(self.workers, context) as executor:
+            futures = collections.deque()
+            for args in tasks:
+                # number of results waiting for the consumer is bounded
+                if len(futures) >= 2 * self.workers:
+                    yield futures.popleft().result()
+                futures.append(executor.submit(func, *args))
+            while futures:
+                yield futures.popleft().result()
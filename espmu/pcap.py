@@ -0,0 +1,400 @@
+""" In this module the import of C37.118 traffic from packet captures
+(pcap and pcapng files, e.g. of switch mirror ports) is implemented
+with the standard library only.
+
+Packets are read one by one, so files of any size are processed in
+bounded memory. Link layers Ethernet (with VLAN tags), Linux cooked
+capture, raw IP and BSD loopback are supported, IP fragments are
+skipped. Payloads of UDP datagrams and reassembled TCP streams are
+split into frames by :class:`espmu.framer.Framer`; every TCP flow has
+its own framer, so frames split between segments are joined. """
+
+import socket
+import struct
+
+from espmu.capture import CONFIG_FRAME_TYPES
+from espmu.framer import Framer
+from espmu.pmuConfigFrame import ConfigFrame
+from espmu.pmuDataFrame import DataFrame
+from espmu.pmuEnum import FrameType
+from espmu.pmuFrame import NS_IN_SEC
+
+DEFAULT_PORTS = (4712, 4713)
+MAX_PENDING = 1024**2
+
+PCAP_MAGIC_US = 0xA1B2C3D4
+PCAP_MAGIC_NS = 0xA1B23C4D
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_IDB = 1
+PCAPNG_PB = 2
+PCAPNG_SPB = 3
+PCAPNG_EPB = 6
+IF_TSRESOL = 9
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_VLAN = (0x8100, 0x88A8, 0x9100)
+IPV6_EXT_HEADERS = (0, 43, 60)
+IPV6_FRAGMENT = 44
+PROTO_TCP = 6
+PROTO_UDP = 17
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+SEQ_MOD = 1 << 32
+
+
+def _seq_diff(seq, base):
+    """ Signed distance between TCP sequence numbers. """
+    diff = (seq - base) % SEQ_MOD
+    return diff - SEQ_MOD if diff >= SEQ_MOD // 2 else diff
+
+
+class _TcpStream:
+    """ Reassembler of one direction of TCP connection. Out of order
+    segments are kept until the missing ones come; if more than
+    max_pending bytes are waiting, the gap is skipped and the framer
+    resynchronizes after it. """
+    def __init__(self, max_pending):
+        self.max_pending = max_pending
+        self.framer = Framer()
+        self.next_seq = None
+        self.segments = {}
+        self.pending = 0
+        self.gaps_num = 0
+
+    def segment(self, seq, flags, payload):
+        """ Add segment and return complete frames. """
+        if flags & TCP_SYN:
+            self.next_seq = (seq + 1) % SEQ_MOD
+            self.framer.reset()
+            self.segments.clear()
+            self.pending = 0
+            return []
+        if not payload:
+            return []
+        if self.next_seq is None:
+            # capture started in the middle of connection
+            self.next_seq = seq
+
+        if _seq_diff(seq, self.next_seq) > 0:
+            if len(payload) > len(self.segments.get(seq, b'')):
+                self.pending += len(payload) - \
+                    len(self.segments.get(seq, b''))
+                self.segments[seq] = payload
+            if self.pending <= self.max_pending:
+                return []
+            self.next_seq = min(
+                self.segments,
+                key=lambda key: _seq_diff(key, self.next_seq))
+            self.framer.reset()
+            self.gaps_num += 1
+            frames = []
+        else:
+            frames = self.__append(seq, payload)
+
+        while self.segments:
+            seq = next((key for key in self.segments
+                        if _seq_diff(key, self.next_seq) <= 0), None)
+            if seq is None:
+                break
+            payload = self.segments.pop(seq)
+            self.pending -= len(payload)
+            frames += self.__append(seq, payload)
+        return frames
+
+    def __append(self, seq, payload):
+        overlap = -_seq_diff(seq, self.next_seq)
+        if overlap >= len(payload):
+            return []  # retransmission
+        payload = payload[overlap:]
+        self.next_seq = (self.next_seq + len(payload)) % SEQ_MOD
+        return self.framer.feed(payload)
+
+
+class PcapReader:
+    """ Reader of C37.118 frames from pcap or pcapng file.
+
+    :param path: Path of capture file
+    :type path: str
+    :param ports: TCP and UDP ports of C37.118 traffic (packets with
+        source or destination port in this list are read), None means
+        all ports
+    :type ports: list
+    :param max_pending: Max number of bytes of out of order TCP
+        segments kept per flow
+    :type max_pending: int
+    """
+    def __init__(self, path, ports=DEFAULT_PORTS, max_pending=MAX_PENDING):
+        self.path = path
+        self.ports = None if ports is None else frozenset(ports)
+        self.max_pending = max_pending
+
+        self.packets_num = 0
+        self.frames_num = 0
+        self.skipped_num = 0
+        self.fragments_num = 0
+        self.gaps_num = 0
+        self.malformed_num = 0
+
+    def packets(self):
+        """ Generator of captured packets.
+
+        :return: Generator of tuples (time in nanoseconds, link type,
+            packet bytes)
+        """
+        with open(self.path, 'rb') as file:
+            head = file.read(4)
+            if len(head) < 4:
+                return
+            if struct.unpack('<I', head)[0] == PCAPNG_SHB:
+                packets = self.__pcapng_packets(file, head)
+            else:
+                packets = self.__pcap_packets(file, head)
+            for packet in packets:
+                self.packets_num += 1
+                yield packet
+
+    def frames(self):
+        """ Generator of frames found in UDP datagrams and TCP streams.
+
+        :return: Generator of tuples (time of packet in nanoseconds,
+            flow (src ip, src port, dst ip, dst port), frame bytes)
+        """
+        streams = {}
+        udp_framer = Framer()
+        for time_ns, linktype, data in self.packets():
+            packet = self.__parse(linktype, data)
+            if packet is None:
+                continue
+            proto, flow, segment = packet
+            if self.ports is not None and flow[1] not in self.ports and \
+               flow[3] not in self.ports:
+                self.skipped_num += 1
+                continue
+
+            if proto == PROTO_UDP:
+                length = struct.unpack_from('!H', segment, 4)[0]
+                frames = udp_framer.feed(segment[8:length])
+                udp_framer.reset()
+            else:
+                seq = struct.unpack_from('!I', segment, 4)[0]
+                offset = (segment[12] >> 4) * 4
+                flags = segment[13]
+                stream = streams.get(flow)
+                if stream is None:
+                    stream = _TcpStream(self.max_pending)
+                    streams[flow] = stream
+                frames = stream.segment(seq, flags, segment[offset:])
+                if flags & (TCP_FIN | TCP_RST):
+                    self.gaps_num += stream.gaps_num
+                    del streams[flow]
+
+            for frame in frames:
+                self.frames_num += 1
+                yield time_ns, flow, frame
+        self.gaps_num += sum(stream.gaps_num for stream in streams.values())
+
+    def data_frames(self):
+        """ Generator of parsed data frames. Config frames of every data
+        source are tracked, data frames of unknown configuration are
+        skipped. Data frames which do not match their config frame
+        (FRAMESIZE differs) are skipped and counted in ``malformed_num``.
+
+        :rtype: generator of :class:`espmu.pmuDataFrame.DataFrame`
+        """
+        configs = {}
+        current = {}
+        for _, flow, frame in self.frames():
+            frame_type = (frame[1] >> 4) & 7
+            source = (flow[0], flow[1], (frame[4] << 8) | frame[5])
+            if frame_type in CONFIG_FRAME_TYPES:
+                # versions differ in content, not in time of sending
+                key = frame[14:-2]
+                config_frame = configs.get(key)
+                if config_frame is None:
+                    config_frame = ConfigFrame.fromBytes(frame)
+                    configs[key] = config_frame
+                current[source] = config_frame
+            elif frame_type == FrameType.Data.value and source in current:
+                try:
+                    data_frame = DataFrame.fromBytes(frame, current[source])
+                except ValueError:
+                    self.malformed_num += 1
+                    continue
+                yield data_frame
+
+    def record(self, recorder):
+        """ Write all frames into recorder.
+
+        :param recorder: Recorder
+        :type recorder: :class:`espmu.capture.CaptureRecorder`
+        :return: Number of recorded frames
+        """
+        frames_num = 0
+        for _, _, frame in self.frames():
+            recorder.write(frame)
+            frames_num += 1
+        return frames_num
+
+    @staticmethod
+    def __pcap_packets(file, head):
+        magic = struct.unpack('<I', head)[0]
+        order = '<'
+        if magic not in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            order = '>'
+            magic = struct.unpack('>I', head)[0]
+        if magic not in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            raise ValueError("Unknown format of capture file")
+        fraction_ns = 1 if magic == PCAP_MAGIC_NS else 1000
+        header = file.read(20)
+        if len(header) < 20:
+            return
+        linktype = struct.unpack(order + 'I', header[16:20])[0] & 0xFFFF
+        record_struct = struct.Struct(order + 'IIII')
+        while True:
+            record = file.read(record_struct.size)
+            if len(record) < record_struct.size:
+                return
+            sec, fraction, caplen, _ = record_struct.unpack(record)
+            data = file.read(caplen)
+            if len(data) < caplen:
+                return  # truncated
+            yield sec * NS_IN_SEC + fraction * fraction_ns, linktype, data
+
+    @staticmethod
+    def __pcapng_packets(file, head):
+        order = '<'
+        interfaces = []
+        while True:
+            if head is None:
+                head = file.read(4)
+            if len(head) < 4:
+                return
+            rest = file.read(4)
+            if len(rest) < 4:
+                return
+            if struct.unpack('<I', head)[0] == PCAPNG_SHB:
+                magic = file.read(4)
+                if len(magic) < 4:
+                    return
+                order = '<' if struct.unpack('<I', magic)[0] == \
+                    PCAPNG_BYTE_ORDER_MAGIC else '>'
+                interfaces = []
+                length = struct.unpack(order + 'I', rest)[0]
+                file.read(length - 12)
+                head = None
+                continue
+            block_type, length = struct.unpack(order + 'II', head + rest)
+            body = file.read(length - 12)
+            file.read(4)
+            head = None
+            if len(body) < length - 12:
+                return  # truncated
+
+            if block_type == PCAPNG_IDB:
+                linktype = struct.unpack_from(order + 'H', body)[0]
+                interfaces.append(
+                    (linktype, _pcapng_resolution(body[8:], order)))
+            elif block_type in (PCAPNG_EPB, PCAPNG_PB):
+                if block_type == PCAPNG_EPB:
+                    if_id, high, low, caplen, _ = \
+                        struct.unpack_from(order + 'IIIII', body)
+                else:
+                    if_id, _, high, low, caplen, _ = \
+                        struct.unpack_from(order + 'HHIIII', body)
+                if if_id >= len(interfaces):
+                    continue
+                linktype, resolution = interfaces[if_id]
+                time_ns = ((high << 32) | low) * NS_IN_SEC // resolution
+                yield time_ns, linktype, body[20:20+caplen]
+            elif block_type == PCAPNG_SPB and interfaces:
+                origlen = struct.unpack_from(order + 'I', body)[0]
+                yield 0, interfaces[0][0], body[4:4+origlen]
+
+    def __parse(self, linktype, data):
+        """ Return tuple (protocol, flow, TCP/UDP segment) or None. """
+        ethertype = None
+        if linktype == LINKTYPE_ETHERNET:
+            pos = 12
+            ethertype = struct.unpack_from('!H', data, pos)[0] \
+                if len(data) >= 14 else None
+            while ethertype in ETHERTYPE_VLAN and len(data) >= pos + 6:
+                pos += 4
+                ethertype = struct.unpack_from('!H', data, pos)[0]
+            data = data[pos+2:]
+        elif linktype == LINKTYPE_LINUX_SLL and len(data) >= 16:
+            ethertype = struct.unpack_from('!H', data, 14)[0]
+            data = data[16:]
+        elif linktype == LINKTYPE_LINUX_SLL2 and len(data) >= 20:
+            ethertype = struct.unpack_from('!H', data)[0]
+            data = data[20:]
+        elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6) \
+                and data:
+            ethertype = ETHERTYPE_IPV6 if data[0] >> 4 == 6 else \
+                ETHERTYPE_IPV4
+        elif linktype == LINKTYPE_NULL and len(data) >= 4:
+            # address family in byte order of capturing host
+            family = max(data[0], data[3])
+            ethertype = ETHERTYPE_IPV4 if family == 2 else ETHERTYPE_IPV6
+            data = data[4:]
+
+        if ethertype == ETHERTYPE_IPV4 and len(data) >= 20:
+            header_len = (data[0] & 0x0F) * 4
+            total_len = struct.unpack_from('!H', data, 2)[0]
+            if struct.unpack_from('!H', data, 6)[0] & 0x3FFF:
+                self.fragments_num += 1
+                return None
+            proto = data[9]
+            src = socket.inet_ntop(socket.AF_INET, data[12:16])
+            dst = socket.inet_ntop(socket.AF_INET, data[16:20])
+            # Ethernet padding is cut by total length
+            segment = data[header_len:total_len]
+        elif ethertype == ETHERTYPE_IPV6 and len(data) >= 40:
+            payload_len = struct.unpack_from('!H', data, 4)[0]
+            proto = data[6]
+            src = socket.inet_ntop(socket.AF_INET6, data[8:24])
+            dst = socket.inet_ntop(socket.AF_INET6, data[24:40])
+            segment = data[40:40+payload_len]
+            while proto in IPV6_EXT_HEADERS and len(segment) >= 8:
+                proto, ext_len = segment[0], (segment[1] + 1) * 8
+                segment = segment[ext_len:]
+            if proto == IPV6_FRAGMENT:
+                self.fragments_num += 1
+                return None
+        else:
+            self.skipped_num += 1
+            return None
+
+        if proto == PROTO_TCP and len(segment) >= 20 or \
+           proto == PROTO_UDP and len(segment) >= 8:
+            src_port, dst_port = struct.unpack_from('!HH', segment)
+            return proto, (src, src_port, dst, dst_port), segment
+        self.skipped_num += 1
+        return None
+
+
+def _pcapng_resolution(options, order):
+    """ Return number of timestamp units per second of interface. """
+    pos = 0
+    while pos + 4 <= len(options):
+        code, length = struct.unpack_from(order + 'HH', options, pos)
+        if code == 0:
+            break
+        if code == IF_TSRESOL and length >= 1:
+            value = options[pos+4]
+            if value & 0x80:
+                return 2 ** (value & 0x7F)
+            return 10 ** value
+        pos += 4 + (length + 3) // 4 * 4
+    return 10**6
@@ -0,0 +1,156 @@
+""" This module implements pipelined reading of data frames. One thread
+receives raw frames and puts batches of them into bounded queue, and
+pool of worker processes decodes the batches. Every worker builds the
+decode plan of the config frame once, at start. Workers are spawned
+(not forked) so they do not hold copies of sockets of the parent. """
+
+import collections
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from operator import attrgetter
+
+from espmu.decoding import Projection
+from espmu.pmuConfigFrame import ConfigFrame
+from espmu.pmuEnum import FrameType
+
+BATCH_SIZE = 256
+QUEUE_SIZE = 64
+MAX_DELAY = 0.1
+
+_projection = None
+
+
+def _init_worker(config_bytes, selection):
+    global _projection
+    _projection = Projection(ConfigFrame.fromBytes(config_bytes), selection)
+
+
+def _decode_batch(frames):
+    samples = [_projection.decode(frame) for frame in frames]
+    samples.sort(key=attrgetter('utcNs'))
+    return samples
+
+
+class Pipeline:
+    """ Pipeline of receiving and decoding data frames.
+
+    :param client: Client connected to data source (data must be
+        turned on)
+    :type client: Client
+    :param config_frame: Config frame of data source
+    :type config_frame: ConfigFrame
+    :param selection: Stations and channels to decode (see
+        :class:`espmu.decoding.Projection`), None means all
+    :type selection: dict
+    :param workers: Number of worker processes, by default number of
+        CPUs
+    :type workers: int
+    :param batch_size: Number of frames in batch
+    :type batch_size: int
+    :param queue_size: Max number of batches waiting for decoding, the
+        receive thread blocks when the queue is full until the consumer
+        of :meth:`samples` takes them
+    :type queue_size: int
+    :param max_delay: Max time (seconds) to collect batch
+    :type max_delay: float
+    """
+    def __init__(self, client, config_frame, selection=None, workers=None,
+                 batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE,
+                 max_delay=MAX_DELAY):
+        if selection is None:
+            selection = {ind: None for ind in range(config_frame.num_pmu)}
+        self.client = client
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.error = None
+
+        self.received_num = 0
+        self.decoded_num = 0
+
+        self.__config_bytes = bytes.fromhex(config_frame.frame)
+        self.__selection = selection
+        self.__queue = queue.Queue(queue_size)
+        self.__thread = None
+        self.__executor = None
+        self.__stopped = threading.Event()
+
+    def start(self):
+        """ Start receive thread and worker processes. """
+        self.__executor = ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.__config_bytes, self.__selection))
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target=self.__receive, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """ Signal the receive thread to stop. It ends after the current
+        read (at most after the socket timeout) and puts the last batch
+        into the queue, nothing received is dropped. Generator
+        :meth:`samples` yields the rest of samples, then it ends and
+        shuts down worker processes. """
+        self.__stopped.set()
+
+    def samples(self):
+        """ Generator of decoded samples. Samples are ordered by
+        timestamps within a batch only, batches are yielded in order of
+        receiving. It ends when receiving is stopped or connection is
+        closed (see :attr:`error`) and all received frames are decoded.
+
+        :rtype: generator of :class:`espmu.decoding.ProjectedFrame`
+        """
+        executor = self.__executor
+        if executor is None:
+            return
+        pending = collections.deque()
+        finished = False
+        while not finished or pending:
+            while not finished and len(pending) < 2*self.workers:
+                try:
+                    batch = self.__queue.get(block=not pending)
+                except queue.Empty:
+                    break
+                if batch is None:
+                    finished = True
+                    break
+                pending.append(executor.submit(_decode_batch, batch))
+            if not pending:
+                continue
+            samples = pending.popleft().result()
+            self.decoded_num += len(samples)
+            yield from samples
+        self.__thread.join()
+        self.__thread = None
+        self.__executor = None
+        executor.shutdown()
+
+    def __receive(self):
+        batch = []
+        batch_time = None
+        try:
+            while not self.__stopped.is_set():
+                for frame in self.client.readFrames():
+                    if (frame[1] >> 4) & 7 == FrameType.Data.value:
+                        batch.append(frame)
+                if not batch:
+                    continue
+                if batch_time is None:
+                    batch_time = time.monotonic()
+                if len(batch) >= self.batch_size or \
+                   time.monotonic() - batch_time >= self.max_delay:
+                    self.received_num += len(batch)
+                    self.__queue.put(batch)
+                    batch = []
+                    batch_time = None
+        except (OSError, ValueError) as exc:
+            self.error = exc
+        if batch:
+            self.received_num += len(batch)
+            self.__queue.put(batch)
+        self.__queue.put(None)
@@ -2,7 +2,7 @@
 
 from espmu.pmuEnum import (NumType, PhsrFmt, FundFreq,
                            MeasurementType, AnlgMsrmnt)
-from espmu.pmuLib import hexToBin
+from espmu.pmuLib import hexToBin, bytesToHexStr
 from espmu.pmuFrame import PMUFrame
 
 
@@ -22,6 +22,20 @@ class ConfigFrame(PMUFrame):
         self.num_pmu = None
         self.stations = None
         self.datarate = None
+        self.decodePlan = None
+
+    @classmethod
+    def fromBytes(cls, frame_bytes, debug=False):
+        """Create completely parsed config frame from its bytes
+
+        :param frame_bytes: Config frame bytes
+        :type frame_bytes: bytes/bytearray/memoryview
+        :param debug: Print debug statements
+        :type debug: bool
+        """
+        config_frame = cls(bytesToHexStr(frame_bytes), debug)
+        config_frame.finishParsing()
+        return config_frame
 
     def finishParsing(self):
         """After first 4 bytes are received, the client reads the
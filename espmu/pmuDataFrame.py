@@ -2,14 +2,28 @@
 
 import math
 import struct
-from datetime import datetime
+from collections import namedtuple
+from collections.abc import Sequence
 
 from espmu.pmuFrame import PMUFrame
+from espmu.decoding import DecodePlan
 from espmu.pmuLib import hexToBin
 from espmu.pmuEnum import (DataError, PmuSync, Sorting, Trigger,
                            ConfigChange, DataModified, TimeQuality,
                            UnlockedTime, TriggerReason)
 
+STAT_DATA_ERROR = 0xC000
+STAT_PMU_SYNC = 0x2000
+STAT_SORTING = 0x1000
+STAT_TRIGGER = 0x0800
+STAT_CONFIG_CHANGE = 0x0400
+STAT_DATA_MODIFIED = 0x0200
+STAT_TIME_QUALITY = 0x01C0
+STAT_UNLOCKED_TIME = 0x0030
+STAT_TRIGGER_REASON = 0x000F
+
+TRIGGER_REASON_USER_DEFINED = "USER_DEFINED"
+
 
 class DataFrame(PMUFrame):
     """
@@ -31,47 +45,215 @@ class DataFrame(PMUFrame):
         self.analog = None
         self.digital = None
         self.parse_pos = 0
+        self.utcNs = None
         self.configFrame = config_frame
         self.dbg = debug
         super().__init__(frame_in_hex_str, self.dbg)
-        super().finishParsing()
-        self.parsePmus()
-        self.updateSOC()
+        if frame_in_hex_str is not None:
+            super().finishParsing()
+            self.parsePmus()
+            self.updateSOC()
+
+    @classmethod
+    def fromBytes(cls, frame_bytes, config_frame, offset=0, debug=False):
+        """Create data frame directly from bytes without converting
+        them to hex string. All fields are unpacked at once using the
+        decode plan of the config frame. The position ``parse_pos`` of
+        the resulting frame is counted in bytes.
+
+        :param frame_bytes: Buffer containing data frame
+        :type frame_bytes: bytes/bytearray/memoryview
+        :param config_frame: Config frame describing the data frame
+        :type config_frame: ConfigFrame
+        :param offset: Position of data frame in the buffer
+        :type offset: int
+        :param debug: Print debug statements
+        :type debug: bool
+        """
+        data_frame = cls(None, config_frame, debug)
+        plan = DecodePlan.for_config(config_frame)
+        values = plan.unpack(frame_bytes, offset)
+        data_frame.setHeaderValues(frame_bytes, offset, values)
+        data_frame.pmus = [
+            PMU.fromValues(values, station_plan, debug)
+            for station_plan in plan.stations
+        ]
+        data_frame.parse_pos = plan.framesize
+        data_frame.updateSOC()
+        return data_frame
 
     def parsePmus(self):
         """Parses each PMU present in the data frame."""
+        plan = DecodePlan.for_config(self.configFrame)
         self.parse_pos = 28
         self.pmus = [None]*self.configFrame.num_pmu
         for i in range(len(self.pmus)):
+            pmu_len = 2*plan.stations[i].size
             self.pmus[i] = PMU(
-                self.frame[self.parse_pos:],
+                self.frame[self.parse_pos:self.parse_pos+pmu_len],
                 self.configFrame.stations[i]
             )
             self.parse_pos += self.pmus[i].length
+        self.parse_pos += 4
 
     def updateSOC(self):
-        """Update SOC."""
-        self.soc.ff = self.fracsec / self.configFrame.time_base.baseDecStr
-        template = "{:0>4}/{:0>2}/{:0>2} {:0>2}:{:0>2}:{:0>2}{}"
-        self.soc.formatted = template.format(
-            self.soc.yyyy,
-            self.soc.mm,
-            self.soc.dd,
-            self.soc.hh,
-            self.soc.mi,
-            self.soc.ss, "{:f}".format(self.soc.ff).lstrip('0')
+        """Update SOC with fraction of second and set UTC timestamp in
+        nanoseconds."""
+        self.soc.setFraction(
+            self.fracsec, self.configFrame.time_base.baseDecStr)
+        self.utcNs = self.soc.utcNs
+
+
+class LazyDataFrame(DataFrame):
+    """
+    Data frame which records only offsets at construction and decodes
+    fields of PMUs the first time they are accessed. Decoded values
+    are cached. The frame is copied unless the buffer is bytes, so
+    reused buffers can be overwritten before fields are decoded.
+
+    :param frame_bytes: Buffer containing data frame
+    :type frame_bytes: bytes/bytearray/memoryview
+    :param config_frame: Config frame describing the data frame
+    :type config_frame: ConfigFrame
+    :param offset: Position of data frame in the buffer
+    :type offset: int
+    :param debug: Print debug statements
+    :type debug: bool
+    """
+
+    def __init__(self, frame_bytes, config_frame, offset=0, debug=False):
+        super().__init__(None, config_frame, debug)
+        plan = DecodePlan.for_config(config_frame)
+        self.parseHeaderBytes(frame_bytes, offset)
+        if self.framesize != plan.framesize:
+            raise ValueError(
+                "Data frame size {} does not match config frame ({})".format(
+                    self.framesize, plan.framesize))
+        self.pmus = LazyList(
+            len(plan.stations),
+            lambda i: LazyPMU(self.frame, plan.stations[i], self.dbg)
         )
-        dt = datetime(
-            self.soc.yyyy,
-            self.soc.mm,
-            self.soc.dd,
-            self.soc.hh,
-            self.soc.mi,
-            self.soc.ss,
-            int(self.soc.ff * 10 ** 6)
+        self.parse_pos = plan.framesize
+        self.updateSOC()
+
+
+class LazyList(Sequence):
+    """Read-only list which creates items on first access
+
+    :param size: Number of items
+    :type size: int
+    :param create: Function creating item by its index
+    :type create: callable
+    """
+
+    def __init__(self, size, create):
+        self.__items = [None]*size
+        self.__create = create
+
+    def __len__(self):
+        return len(self.__items)
+
+    def __getitem__(self, ind):
+        if isinstance(ind, slice):
+            return [self[i] for i in range(*ind.indices(len(self)))]
+        item = self.__items[ind]
+        if item is None:
+            item = self.__create(ind % len(self.__items))
+            self.__items[ind] = item
+        return item
+
+
+class LazyPMU:
+    """PMU in a data frame which decodes its fields on demand
+
+    :param frame_bytes: Data frame bytes
+    :type frame_bytes: bytes/bytearray/memoryview
+    :param station_plan: Positions of PMU fields in data frame
+    :type station_plan: StationPlan
+    :param debug: Print debug statements
+    :type debug: bool
+    """
+
+    def __init__(self, frame_bytes, station_plan, debug=False):
+        self.dbg = debug
+        self.stationFrame = station_plan.station
+        self.numOfPhsrs = self.stationFrame.phnmr
+        self.fmtOfPhsrs = self.stationFrame.phsrFmt
+        self.typeOfPhsrs = self.stationFrame.phsrType
+        self.numOfAnlg = self.stationFrame.annmr
+        self.numOfDgtl = self.stationFrame.dgnmr
+        self.length = station_plan.size
+        self.phasors = LazyList(self.numOfPhsrs, self.__parsePhasor)
+
+        self.__frame = frame_bytes
+        self.__plan = station_plan
+        self.__stat = None
+        self.__freq = None
+        self.__analogs = None
+        self.__digitals = None
+
+    @property
+    def stat(self):
+        """Bit mapped flags"""
+        if self.__stat is None:
+            self.__stat = Stat.fromWord(
+                struct.unpack_from('!H', self.__frame, self.__plan.offset)[0],
+                self.dbg)
+        return self.__stat
+
+    @property
+    def freq(self):
+        """Frequency"""
+        return self.__parseFreq()[0]
+
+    @property
+    def dfreq(self):
+        """Rate of change of frequency (ROCOF)"""
+        return self.__parseFreq()[1]
+
+    @property
+    def analogs(self):
+        """Analog data as list of (name, value) pairs"""
+        if self.__analogs is None:
+            values = self.__plan.analogs_struct.unpack_from(
+                self.__frame, self.__plan.analogs_offset())
+            channels = self.stationFrame.channels[self.numOfPhsrs:]
+            self.__analogs = [
+                (name.strip(), val) for name, val in zip(channels, values)
+            ]
+        return self.__analogs
+
+    @property
+    def digitals(self):
+        """Digital data as list of (name, value) pairs"""
+        if self.__digitals is None:
+            self.__digitals = []
+            if self.numOfDgtl:
+                values = self.__plan.digitals_struct.unpack_from(
+                    self.__frame, self.__plan.digitals_offset())
+                tot_val_bin = "{:016b}".format(values[0])
+                ind = self.numOfPhsrs + self.numOfAnlg
+                channels = self.stationFrame.channels[ind:]
+                self.__digitals = [
+                    (channels[i].strip(), tot_val_bin[i])
+                    for i in range(self.numOfDgtl)
+                ]
+        return self.__digitals
+
+    def __parseFreq(self):
+        if self.__freq is None:
+            freq, dfreq = self.__plan.freq_struct.unpack_from(
+                self.__frame, self.__plan.freq_offset())
+            self.__freq = (freq, dfreq / 100)
+        return self.__freq
+
+    def __parsePhasor(self, ind):
+        val1, val2 = self.__plan.phasor_struct.unpack_from(
+            self.__frame, self.__plan.phasor_offset(ind))
+        return Phasor.fromValues(
+            val1, val2, self.stationFrame,
+            self.stationFrame.channels[ind], self.dbg
         )
-        self.soc.utcSec = (dt - datetime(1970, 1, 1)).total_seconds()
-        self.parse_pos += 4
 
 
 class PMU:
@@ -107,6 +289,8 @@ class PMU:
             print("DIG:", self.numOfDgtl)
 
         self.pmuHex = pmu_hex_str
+        if pmu_hex_str is None:
+            return
         if self.dbg:
             print(pmu_hex_str)
         self.parseStat()
@@ -116,6 +300,56 @@ class PMU:
         self.parseAnalog()
         self.parseDigital()
 
+    @classmethod
+    def fromValues(cls, values, station_plan, debug=False):
+        """Create PMU from values unpacked with decode plan
+
+        :param values: Values of data frame fields
+        :type values: tuple
+        :param station_plan: Positions of PMU fields in values
+        :type station_plan: StationPlan
+        :param debug: Print debug statements
+        :type debug: bool
+        """
+        pmu = cls(None, station_plan.station, debug)
+        pmu.setValues(values, station_plan)
+        return pmu
+
+    def setValues(self, values, station_plan):
+        """Set all PMU fields from values unpacked with decode plan"""
+        self.stat = Stat.fromWord(values[station_plan.stat], self.dbg)
+
+        channels = self.stationFrame.channels
+        ind = station_plan.phasors
+        self.phasors = [None]*self.numOfPhsrs
+        for i in range(self.numOfPhsrs):
+            self.phasors[i] = Phasor.fromValues(
+                values[ind], values[ind+1], self.stationFrame,
+                channels[i], self.dbg
+            )
+            ind += 2
+
+        self.freq = values[station_plan.freq]
+        self.dfreq = values[station_plan.freq+1] / 100
+
+        ind = station_plan.analogs
+        self.analogs = [
+            (channels[self.numOfPhsrs+i].strip(), values[ind+i])
+            for i in range(self.numOfAnlg)
+        ]
+
+        self.digitals = [None]*self.numOfDgtl
+        if self.numOfDgtl:
+            tot_val_bin = "{:016b}".format(values[station_plan.digitals])
+        for i in range(self.numOfDgtl):
+            name = channels[self.numOfPhsrs+self.numOfAnlg+i].strip()
+            self.digitals[i] = (name, tot_val_bin[i])
+
+        self.length = station_plan.size
+        if self.dbg:
+            print("FREQ:", self.freq)
+            print("DFREQ:", self.dfreq)
+
     def updateLength(self, size_to_add):
         """Keeps track of length for PMU frame only"""
         self.length = self.length + size_to_add
@@ -135,9 +369,11 @@ class PMU:
         self.phasors = [None]*self.numOfPhsrs
         if self.dbg:
             print("NumOfPhsrs:", self.numOfPhsrs)
+        phsr_len = 8 if self.typeOfPhsrs == "INTEGER" else 16
         for i in range(self.numOfPhsrs):
             self.phasors[i] = Phasor(
-                self.pmuHex[self.length:], self.stationFrame,
+                self.pmuHex[self.length:self.length+phsr_len],
+                self.stationFrame,
                 self.stationFrame.channels[i]
             )
             if self.dbg:
@@ -198,6 +434,8 @@ class PMU:
     def parseDigital(self):
         """Parse digital data"""
         self.digitals = [None]*self.numOfDgtl
+        if not self.numOfDgtl:
+            return
         leng = 4
         tot_val_bin = hexToBin(self.pmuHex[self.length:self.length+leng], 16)
         for i in range(self.numOfDgtl):
@@ -248,7 +486,30 @@ class Phasor:
             print("*", name.strip(), "*")
 
         self.parseFmt()
-        self.parseVal()
+        if phsr_val_hex is not None:
+            self.parseVal()
+
+    @classmethod
+    def fromValues(cls, val1, val2, station_frame, name, debug=False):
+        """Create phasor from two already unpacked values
+
+        :param val1: Real part or magnitude
+        :type val1: int/float
+        :param val2: Imaginary part or angle
+        :type val2: int/float
+        :param station_frame: Station frame which describe data format
+        :type station_frame: Station
+        :param name: Name of phasor channel
+        :type name: str
+        :param debug: Print debug statements
+        :type debug: bool
+        """
+        phasor = cls(None, station_frame, name, debug)
+        if phasor.phsrFmt == "RECT":
+            phasor.setRect(val1, val2)
+        else:
+            phasor.setPolar(val1, val2)
+        return phasor
 
     def parseFmt(self):
         """Parse format and type of phasor"""
@@ -268,14 +529,22 @@ class Phasor:
         hex1 = hex_val[:int(self.length/2)]
         hex2 = hex_val[int(self.length/2):]
         unpack_str = "!h" if self.phsrType == "INTEGER" else "!f"
-        self.real = struct.unpack(unpack_str, bytes.fromhex(hex1))[0]
-        self.imag = struct.unpack(unpack_str, bytes.fromhex(hex2))[0]
+        self.setRect(
+            struct.unpack(unpack_str, bytes.fromhex(hex1))[0],
+            struct.unpack(unpack_str, bytes.fromhex(hex2))[0]
+        )
+        if self.dbg:
+            print("Real:", hex1, "=", self.real)
+            print("Imag:", hex2, "=", self.imag)
+
+    def setRect(self, real, imag):
+        """Set values from rectangular components"""
+        self.real = real
+        self.imag = imag
         self.mag = math.hypot(self.real, self.imag)
         self.rad = math.atan2(self.imag, self.real)
         self.deg = math.degrees(self.rad)
         if self.dbg:
-            print("Real:", hex1, "=", self.real)
-            print("Imag:", hex2, "=", self.imag)
             print("Mag:", "=", self.mag)
             print("Rad:", "=", self.rad)
             print("Deg:", "=", self.deg)
@@ -285,18 +554,27 @@ class Phasor:
         hex1 = hex_val[:int(self.length/2)]
         hex2 = hex_val[int(self.length/2):]
         unpack_str = "!h" if self.phsrType == "INTEGER" else "!f"
-        self.mag = struct.unpack(unpack_str, bytes.fromhex(hex1))[0]
-        self.rad = struct.unpack(unpack_str, bytes.fromhex(hex2))[0]
-        if unpack_str == '!h':
+        self.setPolar(
+            struct.unpack(unpack_str, bytes.fromhex(hex1))[0],
+            struct.unpack(unpack_str, bytes.fromhex(hex2))[0]
+        )
+        if self.dbg:
+            print("Mag:", hex1, "=", self.mag)
+            print("Rad:", hex2, "=", self.rad)
+
+    def setPolar(self, mag, ang):
+        """Set values from magnitude and angle (raw angle for INTEGER
+        format)"""
+        self.mag = mag
+        self.rad = ang
+        if self.phsrType == "INTEGER":
             self.rad = self.rad / 10000
         self.deg = math.degrees(self.rad)
         self.real = self.mag * math.cos(self.deg)
         self.imag = self.mag * math.sin(self.deg)
         if self.dbg:
-            print("Real:", hex1, "=", self.real)
-            print("Imag:", hex2, "=", self.imag)
-            print("Mag:", "=", self.mag)
-            print("Rad:", "=", self.rad)
+            print("Real:", "=", self.real)
+            print("Imag:", "=", self.imag)
             print("Deg:", "=", self.deg)
 
 
@@ -320,82 +598,146 @@ class Stat:
         self.timeQuality = None
         self.unlockedTime = None
         self.triggerReason = None
+        self.word = None
 
         self.dbg = debug
         self.statHex = stat_hex_str
-
+        if stat_hex_str is None:
+            return
+        self.parseWord(int(stat_hex_str, 16))
+
+    @classmethod
+    def fromWord(cls, stat_word, debug=False):
+        """Create Stat from 16-bit integer word
+
+        :param stat_word: Stat field
+        :type stat_word: int
+        :param debug: Print debug statements
+        :type debug: bool
+        """
+        stat = cls(None, debug)
+        stat.statHex = "{:04X}".format(stat_word)
+        stat.parseWord(stat_word)
+        return stat
+
+    def parseWord(self, stat_word):
+        """Parse all flags from 16-bit integer word"""
+        flags = statFromWord(stat_word)
+        self.word = flags.word
+        self.dataError = flags.dataError
+        self.pmuSync = flags.pmuSync
+        self.sorting = flags.sorting
+        self.pmuTrigger = flags.pmuTrigger
+        self.configChange = flags.configChange
+        self.dataModified = flags.dataModified
+        self.timeQuality = flags.timeQuality
+        self.unlockedTime = flags.unlockedTime
+        self.triggerReason = flags.triggerReason
         if self.dbg:
-            print(stat_hex_str)
-
-        self.parseDataError()
-        self.parsePmuSync()
-        self.parseSorting()
-        self.parsePmuTrigger()
-        self.parseConfigChange()
-        self.parseDataModified()
-        self.parseTimeQuality()
-        self.parseUnlockTime()
-        self.parseTriggerReason()
+            print("STAT: ", "{:04X}".format(stat_word))
 
     def parseDataError(self):
         """Parse data error bits"""
-        self.dataError = DataError(
-            int(hexToBin(self.statHex[0], 4)[:2], 2)).name
+        self.dataError = statFromWord(self.word).dataError
         if self.dbg:
             print("STAT: ", self.dataError)
 
     def parsePmuSync(self):
         """Parse PMU sync bit"""
-        self.pmuSync = PmuSync(
-            int(hexToBin(self.statHex[0], 4)[2], 2)).name
+        self.pmuSync = statFromWord(self.word).pmuSync
         if self.dbg:
             print("PMUSYNC: ", self.pmuSync)
 
     def parseSorting(self):
         """Parse data sorting bit"""
-        self.sorting = Sorting(
-            int(hexToBin(self.statHex[0], 4)[3], 2)).name
+        self.sorting = statFromWord(self.word).sorting
         if self.dbg:
             print("SORTING: ", self.sorting)
 
     def parsePmuTrigger(self):
         """Parse PMU trigger bit"""
-        self.pmuTrigger = Trigger(
-            int(hexToBin(self.statHex[1], 4)[0], 2)).name
+        self.pmuTrigger = statFromWord(self.word).pmuTrigger
         if self.dbg:
             print("PMUTrigger: ", self.pmuTrigger)
 
     def parseConfigChange(self):
         """Parse config change bit"""
-        self.configChange = ConfigChange(
-            int(hexToBin(self.statHex[1], 4)[1], 2)).name
+        self.configChange = statFromWord(self.word).configChange
         if self.dbg:
             print("ConfigChange: ", self.configChange)
 
     def parseDataModified(self):
         """Parse data modified bit"""
-        self.dataModified = DataModified(
-            int(hexToBin(self.statHex[1], 4)[2], 2)).name
+        self.dataModified = statFromWord(self.word).dataModified
         if self.dbg:
             print("DataModified: ", self.dataModified)
 
     def parseTimeQuality(self):
         """Parse time quality bits"""
-        self.unlockedTime = TimeQuality(
-            int(hexToBin(self.statHex[1:3], 8)[3:6], 2)).name
+        self.timeQuality = statFromWord(self.word).timeQuality
         if self.dbg:
-            print("TimeQuality: ", self.unlockedTime)
+            print("TimeQuality: ", self.timeQuality)
 
     def parseUnlockTime(self):
         """Parse unlocked time bits"""
-        self.unlockedTime = UnlockedTime(
-            int(hexToBin(self.statHex[2], 4)[2:], 2)).name
+        self.unlockedTime = statFromWord(self.word).unlockedTime
         if self.dbg:
             print("UnlockTime: ", self.unlockedTime)
 
     def parseTriggerReason(self):
         """Parse trigger reason bits"""
-        self.triggerReason = TriggerReason(
-            int(hexToBin(self.statHex[3], 4), 2)).name
+        self.triggerReason = statFromWord(self.word).triggerReason
         if self.dbg:
             print("TriggerReason: ", self.triggerReason)
+
+
+StatFlags = namedtuple('StatFlags', [
+    'word', 'dataError', 'pmuSync', 'sorting', 'pmuTrigger',
+    'configChange', 'dataModified', 'timeQuality', 'unlockedTime',
+    'triggerReason'
+])
+StatFlags.__doc__ = """Immutable decoded STAT word. The raw integer is
+kept in ``word`` and can be tested with ``STAT_*`` masks."""
+
+_STAT_TABLE = [None]*0x10000
+
+
+def statFromWord(stat_word):
+    """Return decoded STAT word. Every possible word is decoded only
+    once, then the shared record is taken from the table.
+
+    :param stat_word: Stat field
+    :type stat_word: int
+
+    :return: Decoded flags
+    :rtype: StatFlags
+    """
+    flags = _STAT_TABLE[stat_word]
+    if flags is None:
+        flags = _decodeStatWord(stat_word)
+        _STAT_TABLE[stat_word] = flags
+    return flags
+
+
+def _decodeStatWord(stat_word):
+    trigger_reason = stat_word & STAT_TRIGGER_REASON
+    if trigger_reason < len(TriggerReason):
+        trigger_reason = TriggerReason(trigger_reason).name
+    else:
+        trigger_reason = TRIGGER_REASON_USER_DEFINED
+
+    return StatFlags(
+        word=stat_word,
+        dataError=DataError((stat_word & STAT_DATA_ERROR) >> 14).name,
+        pmuSync=PmuSync((stat_word & STAT_PMU_SYNC) >> 13).name,
+        sorting=Sorting((stat_word & STAT_SORTING) >> 12).name,
+        pmuTrigger=Trigger((stat_word & STAT_TRIGGER) >> 11).name,
+        configChange=ConfigChange(
+            (stat_word & STAT_CONFIG_CHANGE) >> 10).name,
+        dataModified=DataModified(
+            (stat_word & STAT_DATA_MODIFIED) >> 9).name,
+        timeQuality=TimeQuality((stat_word & STAT_TIME_QUALITY) >> 6).name,
+        unlockedTime=UnlockedTime(
+            (stat_word & STAT_UNLOCKED_TIME) >> 4).name,
+        triggerReason=trigger_reason
+    )
@@ -115,3 +115,10 @@ class Unit(Enum):
     AMPS = 1
     RADIANS = 2
     DEGREES = 3
+
+
+class BufferPolicy(Enum):
+    BLOCK = 0
+    DROP_OLDEST = 1
+    DROP_NEWEST = 2
+    DECIMATE = 3
@@ -1,8 +1,14 @@
 """In this module the base class for frames is defined."""
-from datetime import datetime
+import struct
+import time
+from functools import lru_cache
 from espmu.pmuEnum import FrameType
 from espmu.pmuLib import hexToBin
 
+HEADER_STRUCT = struct.Struct('!HHHII')
+CHK_STRUCT = struct.Struct('!H')
+NS_IN_SEC = 10**9
+
 
 class PMUFrame:
     """
@@ -27,9 +33,13 @@ class PMUFrame:
         self.length = 0
 
         self.dbg = debug
-        self.frame = frame_in_hex_str.upper()
-        self.parseSYNC()
-        self.parseFRAMESIZE()
+        self.frame = None
+        self.sync = None
+        self.framesize = None
+        if frame_in_hex_str is not None:
+            self.frame = frame_in_hex_str.upper()
+            self.parseSYNC()
+            self.parseFRAMESIZE()
 
         self.idcode = None
         self.soc = None
@@ -51,6 +61,54 @@ class PMUFrame:
         self.parseFRACSEC()
         self.parseCHK()
 
+    def parseHeaderBytes(self, frame_bytes, offset=0):
+        """Parse common frame fields directly from bytes.
+
+        After parsing ``self.frame`` is a view of the frame bytes and
+        ``self.length`` is counted in bytes. The view is zero-copy only
+        if the buffer is owned (bytes or view of bytes), other buffers
+        (e.g. the one reused by :meth:`espmu.client.Client.readFrame`)
+        can be overwritten later, so the frame is copied.
+
+        :param frame_bytes: Buffer containing the frame
+        :type frame_bytes: bytes/bytearray/memoryview
+        :param offset: Position of the frame in the buffer
+        :type offset: int
+        """
+        header = HEADER_STRUCT.unpack_from(frame_bytes, offset)
+        chk = CHK_STRUCT.unpack_from(frame_bytes, offset + header[1] - 2)
+        self.setHeaderValues(frame_bytes, offset, header + chk)
+
+    def setHeaderValues(self, frame_bytes, offset, values):
+        """Set common frame fields from unpacked values.
+
+        :param frame_bytes: Buffer containing the frame
+        :type frame_bytes: bytes/bytearray/memoryview
+        :param offset: Position of the frame in the buffer
+        :type offset: int
+        :param values: SYNC, FRAMESIZE, IDCODE, SOC, FRACSEC and other
+            fields of the frame with CHK as the last one
+        :type values: tuple
+        """
+        sync, self.framesize, self.idcode, soc, fracsec = values[:5]
+        view = memoryview(frame_bytes)
+        self.frame = view[offset:offset+self.framesize]
+        if not isinstance(view.obj, bytes):
+            self.frame = memoryview(bytes(self.frame))
+        self.sync = SYNC.fromWord(sync, self.dbg)
+        self.soc = SOC.fromSecCount(soc, self.dbg)
+        self.tq = fracsec >> 24
+        self.fracsec = fracsec & 0xFFFFFF
+        self.chk = "{:04X}".format(values[-1])
+        self.length = HEADER_STRUCT.size
+
+        if self.dbg:
+            print("FRAMESIZE: ", self.framesize)
+            print("IDCODE: ", self.idcode)
+            print("TQ: ", self.tq)
+            print("FRACSEC: ", self.fracsec)
+            print("CHK: ", self.chk)
+
     def parseSYNC(self):
         """Parse frame synchronization word"""
         self.sync = SYNC(self.frame[:4])
@@ -125,13 +183,31 @@ class SYNC:
     """
 
     def __init__(self, sync_hex_str, debug=False):
+        self.frameType = None
+        self.frameVers = None
+
         self.dbg = debug
         self.syncHex = sync_hex_str
-        self.parseType()
-        self.parseVers()
+        if sync_hex_str is not None:
+            self.parseType()
+            self.parseVers()
 
-        self.frameType = None
-        self.frameVers = None
+    @classmethod
+    def fromWord(cls, sync_word, debug=False):
+        """Create SYNC from 16-bit integer word
+
+        :param sync_word: Sync word
+        :type sync_word: int
+        :param debug: Print debug statements
+        :type debug: bool
+        """
+        sync = cls(None, debug)
+        sync.frameType = FrameType((sync_word >> 4) & 7).name
+        sync.frameVers = sync_word & 15
+        if sync.dbg:
+            print("Type: ", sync.frameType)
+            print("Vers: ", sync.frameVers)
+        return sync
 
     def parseType(self):
         """Parse frame type"""
@@ -154,6 +230,10 @@ class SYNC:
 class SOC:
     """Class for second-of-century (SOC) word (32 bit unsigned)
 
+    The time is kept as integers. Calendar fields and formatted string
+    are computed (in UTC) only when requested, the conversion of the
+    second is cached.
+
     :param soc_hex_str: Second-of-century byte array in hex str format
     :type soc_hex_str: str
     :param debug: Print debug statements
@@ -163,23 +243,100 @@ class SOC:
     def __init__(self, soc_hex_str, debug=False):
         self.dbg = debug
         self.socHex = soc_hex_str
-        self.secCount = int(soc_hex_str, 16)
-        self.parseSecCount()
+        self.secCount = None
+        self.ff = 0
+        self.fracNs = 0
+        self.__hasFraction = False
+        if soc_hex_str is not None:
+            self.setSecCount(int(soc_hex_str, 16))
+
+    @classmethod
+    def fromSecCount(cls, sec_count, debug=False):
+        """Create SOC from integer second-of-century value
+
+        :param sec_count: Second-of-century
+        :type sec_count: int
+        :param debug: Print debug statements
+        :type debug: bool
+        """
+        soc = cls(None, debug)
+        soc.setSecCount(sec_count)
+        return soc
+
+    def setSecCount(self, sec_count):
+        """Set second-of-century value"""
+        self.secCount = sec_count
         if self.dbg:
             print("SOC: ", self.secCount, " - ", self.formatted)
 
-    def parseSecCount(self):
-        """Parse SOC into UTC timestamp and pretty formatted timestamp"""
-        parsed_date = datetime.fromtimestamp(self.secCount)
-        self.yyyy = parsed_date.year
-        self.mm = parsed_date.month
-        self.dd = parsed_date.day
-        self.hh = parsed_date.hour
-        self.mi = parsed_date.minute
-        self.ss = parsed_date.second
-        self.ff = 0
-        self.formatted = "{:0>4}/{:0>2}/{:0>2} {:0>2}:{:0>2}:{:0>2}".format(
-            self.yyyy, self.mm, self.dd, self.hh, self.mi, self.ss
-        )
-        dt = datetime(self.yyyy, self.mm, self.dd, self.hh, self.mi, self.ss)
-        self.utcSec = (dt - datetime(1970, 1, 1)).total_seconds()
+    def setFraction(self, fracsec, time_base):
+        """Set fraction of second
+
+        :param fracsec: Fraction of second (FRACSEC without time
+            quality)
+        :type fracsec: int
+        :param time_base: Resolution of FRACSEC (TIME_BASE)
+        :type time_base: int
+        """
+        self.ff = fracsec / time_base
+        self.fracNs = fracsec * NS_IN_SEC // time_base
+        self.__hasFraction = True
+
+    @property
+    def utcNs(self):
+        """UTC timestamp in nanoseconds"""
+        return self.secCount * NS_IN_SEC + self.fracNs
+
+    @property
+    def utcSec(self):
+        """UTC timestamp in seconds"""
+        return self.secCount + self.ff
+
+    @property
+    def yyyy(self):
+        """Year"""
+        return _secondFields(self.secCount)[0]
+
+    @property
+    def mm(self):
+        """Month"""
+        return _secondFields(self.secCount)[1]
+
+    @property
+    def dd(self):
+        """Day"""
+        return _secondFields(self.secCount)[2]
+
+    @property
+    def hh(self):
+        """Hour"""
+        return _secondFields(self.secCount)[3]
+
+    @property
+    def mi(self):
+        """Minute"""
+        return _secondFields(self.secCount)[4]
+
+    @property
+    def ss(self):
+        """Second"""
+        return _secondFields(self.secCount)[5]
+
+    @property
+    def formatted(self):
+        """Pretty formatted timestamp"""
+        formatted = _formatSecond(self.secCount)
+        if self.__hasFraction:
+            formatted += "{:f}".format(self.ff).lstrip('0')
+        return formatted
+
+
+@lru_cache(maxsize=16)
+def _secondFields(sec_count):
+    return time.gmtime(sec_count)[:6]
+
+
+@lru_cache(maxsize=16)
+def _formatSecond(sec_count):
+    return "{:0>4}/{:0>2}/{:0>2} {:0>2}:{:0>2}:{:0>2}".format(
+        *_secondFields(sec_count))
@@ -1,6 +1,12 @@
 """Server implementation."""
+import selectors
 import socket
 
+from espmu.framer import Framer, MAX_FRAME_SIZE, MIN_FRAME_SIZE, SYNC_BYTE
+from espmu.pmuFrame import NS_IN_SEC
+
+DATAGRAMS_NUM = 64
+
 
 class Server:
     """
@@ -25,6 +31,18 @@ class Server:
         self.clientAddr = None
         self.serverAddr = ""
         self.__print_info = print_info
+        self.__framer = Framer()
+        self.recorder = None
+
+        self.__pool = []
+        self.__poolViews = []
+        self.__periodNs = None
+        self.__timeBase = None
+        self.__lastTimes = {}
+        self.datagramsNum = 0
+        self.malformedNum = 0
+        self.gapsNum = 0
+        self.lostNum = 0
 
         self.serverPort = the_port
         self.serverAddr = (self.serverAddr, self.serverPort)
@@ -73,6 +91,8 @@ class Server:
         data = ""
         if self.useUdp:
             data = self.socketConn.recvfrom(length)[0]
+            if data and self.recorder is not None:
+                self.recorder.write(data)
         else:
             if self.connection is None:
                 self.waitForConnection()
@@ -83,6 +103,104 @@ class Server:
 
         return data
 
+    def readFrames(self):
+        """Receive available bytes and return all complete frames.
+        Bytes of incomplete frame are kept until the next call.
+
+        :return: List of frames (bytes)
+        """
+        if self.useUdp:
+            sock = self.socketConn
+        else:
+            if self.connection is None:
+                self.waitForConnection()
+            sock = self.connection
+
+        received = sock.recv_into(self.__framer.recv_buffer())
+        if not received:
+            self.__info("Invalid/No Data Received")
+            if not self.useUdp:
+                self.connection.close()
+                self.connection = None
+                self.__framer.reset()
+        frames = self.__framer.received(received)
+        if self.recorder is not None:
+            self.recorder.write_frames(frames)
+        return frames
+
+    def setRecorder(self, recorder):
+        """Record every frame read by :meth:`readFrames` and
+        :meth:`readDatagrams` (and datagram read by :meth:`readSample`)
+
+        :param recorder: Recorder or None to stop recording
+        :type recorder: :class:`espmu.capture.CaptureRecorder`
+        """
+        self.recorder = recorder
+
+    def setReceiveBufferSize(self, size):
+        """Set size of socket receive buffer (SO_RCVBUF). The kernel
+        may adjust the value, so the actual size is returned.
+
+        :param size: Size of buffer in bytes
+        :type size: int
+        :return: Actual size of buffer
+        """
+        self.socketConn.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+        return self.socketConn.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+    def setConfigFrame(self, config_frame):
+        """Set config frame of data source. Its DATA_RATE and TIME_BASE
+        are used to detect sequence gaps in :meth:`readDatagrams`.
+
+        :param config_frame: Config frame of data source
+        :type config_frame: ConfigFrame
+        """
+        datarate = config_frame.datarate
+        if datarate >= 0x8000:
+            datarate -= 0x10000
+        if datarate > 0:
+            self.__periodNs = NS_IN_SEC // datarate
+        elif datarate < 0:
+            self.__periodNs = -datarate * NS_IN_SEC
+        else:
+            self.__periodNs = None
+        self.__timeBase = config_frame.time_base.baseDecStr
+        self.__lastTimes = {}
+
+    def readDatagrams(self, max_num=DATAGRAMS_NUM):
+        """Wait for UDP datagrams and drain all the pending ones (at most
+        max_num). Datagrams are received into a pool of reused buffers.
+        Every datagram should contain exactly one frame, the other ones
+        are counted as malformed and skipped.
+
+        Counters ``datagramsNum``, ``malformedNum``, ``gapsNum`` (number
+        of breaks in sequence of data frames) and ``lostNum`` (number of
+        missing data frames) are updated. Gaps are detected only after
+        :meth:`setConfigFrame` is called.
+
+        :param max_num: Maximal number of datagrams to return
+        :type max_num: int
+        :return: List of frames (memoryview objects valid until the
+            next call)
+        """
+        while len(self.__pool) < max_num:
+            buf = bytearray(MAX_FRAME_SIZE)
+            self.__pool.append(buf)
+            self.__poolViews.append(memoryview(buf))
+
+        frames = []
+        self.__receiveDatagram(0, frames)
+        timeout = self.socketConn.gettimeout()
+        self.socketConn.setblocking(False)
+        try:
+            for i in range(1, max_num):
+                self.__receiveDatagram(i, frames)
+        except BlockingIOError:
+            pass
+        finally:
+            self.socketConn.settimeout(timeout)
+        return frames
+
     def stop(self):
         """Closes server connections"""
         self.__info("\n**********")
@@ -104,9 +222,167 @@ class Server:
         """
         self.socketConn.settimeout(secs_num)
 
+    def __receiveDatagram(self, i, frames):
+        size = self.socketConn.recv_into(self.__pool[i], MAX_FRAME_SIZE)
+        self.datagramsNum += 1
+        frame = self.__poolViews[i][:size]
+        if not self.__checkDatagram(frame):
+            self.malformedNum += 1
+            return
+        if self.__periodNs is not None and (frame[1] & 0x70) == 0:
+            self.__checkSequence(frame)
+        if self.recorder is not None:
+            self.recorder.write(frame)
+        frames.append(frame)
+
+    @staticmethod
+    def __checkDatagram(frame):
+        return len(frame) >= MIN_FRAME_SIZE and \
+            frame[0] == SYNC_BYTE and \
+            ((frame[2] << 8) | frame[3]) == len(frame)
+
+    def __checkSequence(self, frame):
+        idcode = (frame[4] << 8) | frame[5]
+        soc = (frame[6] << 24) | (frame[7] << 16) | (frame[8] << 8) | frame[9]
+        fracsec = (frame[11] << 16) | (frame[12] << 8) | frame[13]
+        time_ns = soc * NS_IN_SEC + fracsec * NS_IN_SEC // self.__timeBase
+
+        last_ns = self.__lastTimes.get(idcode)
+        self.__lastTimes[idcode] = time_ns
+        if last_ns is None or time_ns <= last_ns:
+            return
+        steps = (time_ns - last_ns + self.__periodNs // 2) // self.__periodNs
+        if steps > 1:
+            self.gapsNum += 1
+            self.lostNum += steps - 1
+
     def __info(self, *args):
         if self.__print_info:
             print(*args)
 
     def __class__(self):
         return "server"
+
+
+class MultiServer:
+    """
+    TCP server accepting many PMUs or PDCs at once. Sockets are
+    non-blocking and multiplexed by :mod:`selectors`, so a slow or
+    closed connection does not affect the others.
+
+    :param the_port: Local port to listen on
+    :type the_port: int
+    :param queue_len: Max number of queued connections
+    :type queue_len: int
+    :param print_info: Specifies whether or not to print debug statements
+    :type print_info: bool
+    """
+
+    def __init__(self, the_port, queue_len=5, print_info=False):
+        self.serverAddr = ("", the_port)
+        self.connections = {}
+        self.framesNum = 0
+        self.recorder = None
+        self.__print_info = print_info
+        self.__selector = selectors.DefaultSelector()
+
+        self.socketConn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socketConn.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socketConn.bind(self.serverAddr)
+        self.socketConn.listen(queue_len)
+        self.socketConn.setblocking(False)
+        self.__selector.register(self.socketConn, selectors.EVENT_READ)
+        self.__info("Starting TCP Server on", self.serverAddr)
+
+    def readFrames(self, timeout=None):
+        """Wait for data at most timeout seconds, accept new connections,
+        receive available bytes from all ready connections and return
+        complete frames. Bytes of incomplete frames are kept per
+        connection until the next call.
+
+        :param timeout: Time to wait in seconds (None means forever)
+        :type timeout: float
+        :return: List of tuples (peer address, IDCODE, frame bytes)
+        """
+        frames = []
+        for key, _ in self.__selector.select(timeout):
+            if key.data is None:
+                self.__accept()
+                continue
+            conn = key.fileobj
+            framer = key.data
+            try:
+                received = conn.recv_into(framer.recv_buffer())
+            except BlockingIOError:
+                continue
+            except OSError as exc:
+                self.__info("Connection error", exc)
+                received = 0
+            if not received:
+                self.__close(conn)
+                continue
+            peer = self.connections[conn]
+            for frame in framer.received(received):
+                frames.append((peer, (frame[4] << 8) | frame[5], frame))
+                if self.recorder is not None:
+                    self.recorder.write(frame)
+        self.framesNum += len(frames)
+        return frames
+
+    def sendData(self, peer, data):
+        """Send data (for example, command frame) to connected peer
+
+        :param peer: Address of peer
+        :type peer: tuple
+        :param data: Bytes to send
+        :type data: bytes
+        """
+        for conn, conn_peer in self.connections.items():
+            if conn_peer == peer:
+                conn.setblocking(True)
+                try:
+                    conn.sendall(data)
+                finally:
+                    conn.setblocking(False)
+                return
+        raise KeyError(peer)
+
+    def setRecorder(self, recorder):
+        """Record every frame read by :meth:`readFrames`
+
+        :param recorder: Recorder or None to stop recording
+        :type recorder: :class:`espmu.capture.CaptureRecorder`
+        """
+        self.recorder = recorder
+
+    def peers(self):
+        """Return list of addresses of connected peers"""
+        return list(self.connections.values())
+
+    def stop(self):
+        """Close all connections and the listening socket"""
+        for conn in list(self.connections):
+            self.__close(conn)
+        self.__selector.unregister(self.socketConn)
+        self.socketConn.close()
+        self.__selector.close()
+        self.__info("Stopping", self.serverAddr)
+
+    def __accept(self):
+        try:
+            conn, addr = self.socketConn.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        self.connections[conn] = addr
+        self.__selector.register(conn, selectors.EVENT_READ, Framer())
+        self.__info("Connected", addr)
+
+    def __close(self, conn):
+        self.__info("Disconnected", self.connections.pop(conn, None))
+        self.__selector.unregister(conn)
+        conn.close()
+
+    def __info(self, *args):
+        if self.__print_info:
+            print(*args)
@@ -0,0 +1,281 @@
+""" In this module the ring buffer of decoded samples in shared memory
+is implemented. One process (writer) decodes data frames and puts the
+samples into the ring, any number of processes (readers) attach to it
+by name and read the samples as NumPy views without copying. NumPy is
+required for this module.
+
+Layout of shared memory block: header, config frame bytes and arrays
+of the ring (sequence numbers, time, stat, freq, dfreq, mag, rad,
+analogs). Phasors and analogs of all stations are stored in one row,
+see :meth:`RingReader.station_columns`. """
+
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from espmu.batch import decode_frames
+from espmu.pmuConfigFrame import ConfigFrame
+
+MAGIC = 0x45535052494E4731  # "ESPRING1"
+HEADER_FIELDS_NUM = 8
+CAPACITY = 4096
+
+_MAGIC, _CAPACITY, _NUM_PMU, _PHASORS_NUM, _ANALOGS_NUM, _CONF_SIZE, \
+    _WRITE_SEQ, _RESERVED_SEQ = range(HEADER_FIELDS_NUM)
+
+
+def _align(size):
+    return (size + 7) & ~7
+
+
+def _layout(config_frame, capacity, conf_size):
+    num_pmu = config_frame.num_pmu
+    phasors_num = sum(st.phnmr for st in config_frame.stations)
+    analogs_num = sum(st.annmr for st in config_frame.stations)
+    fields = [
+        ('seq', np.int64, ()),
+        ('time_ns', np.int64, ()),
+        ('stat', np.uint16, (num_pmu,)),
+        ('freq', np.float64, (num_pmu,)),
+        ('dfreq', np.float64, (num_pmu,)),
+        ('mag', np.float64, (phasors_num,)),
+        ('rad', np.float64, (phasors_num,)),
+        ('analogs', np.float64, (analogs_num,)),
+    ]
+    layout = []
+    offset = 8*HEADER_FIELDS_NUM + _align(conf_size)
+    for name, dtype, shape in fields:
+        shape = (capacity,) + shape
+        layout.append((name, dtype, shape, offset))
+        offset += _align(int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    return layout, offset
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # before Python 3.13 attached block is registered in resource
+        # tracker which removes it when the reader exits
+        shm = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class _Ring:
+    """ Arrays of the ring placed in shared memory block. """
+    def __init__(self, shm, config_frame, capacity, conf_size):
+        self.header = np.ndarray((HEADER_FIELDS_NUM,), np.int64, shm.buf)
+        self.capacity = capacity
+        self.arrays = {
+            name: np.ndarray(shape, dtype, shm.buf, offset)
+            for name, dtype, shape, offset in
+            _layout(config_frame, capacity, conf_size)[0]
+        }
+
+
+class RingWriter:
+    """ Writer of decoded samples into shared memory ring.
+
+    :param config_frame: Config frame of data source
+    :type config_frame: ConfigFrame
+    :param capacity: Number of samples in the ring
+    :type capacity: int
+    :param name: Name of shared memory block, generated if None
+    :type name: str
+    """
+    def __init__(self, config_frame, capacity=CAPACITY, name=None):
+        conf_bytes = bytes.fromhex(config_frame.frame)
+        size = _layout(config_frame, capacity, len(conf_bytes))[1]
+        self.config_frame = config_frame
+        self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self.name = self.shm.name
+
+        self.__ring = _Ring(self.shm, config_frame, capacity, len(conf_bytes))
+        self.__arrays = self.__ring.arrays
+        self.__arrays['seq'][:] = -1
+        header = self.__ring.header
+        header[_CAPACITY] = capacity
+        header[_NUM_PMU] = config_frame.num_pmu
+        header[_PHASORS_NUM] = self.__arrays['mag'].shape[1]
+        header[_ANALOGS_NUM] = self.__arrays['analogs'].shape[1]
+        header[_CONF_SIZE] = len(conf_bytes)
+        header[_WRITE_SEQ] = 0
+        header[_RESERVED_SEQ] = 0
+        start = header.nbytes
+        self.shm.buf[start:start+len(conf_bytes)] = conf_bytes
+        header[_MAGIC] = MAGIC
+
+    @property
+    def write_seq(self):
+        """ Sequence number of the next sample. """
+        return int(self.__ring.header[_WRITE_SEQ])
+
+    def write_frames(self, frames_bytes):
+        """ Decode concatenated data frames and write samples.
+
+        :param frames_bytes: Concatenated data frames
+        :type frames_bytes: bytes/bytearray/memoryview
+        """
+        self.write(decode_frames(frames_bytes, self.config_frame))
+
+    def write(self, batch):
+        """ Write decoded samples. If there are more samples than the
+        capacity of the ring, only the last ones are written.
+
+        :param batch: Decoded data frames
+        :type batch: :class:`espmu.batch.BatchData`
+        """
+        capacity = self.__ring.capacity
+        header = self.__ring.header
+        seqs = self.__arrays['seq']
+        columns = {
+            'time_ns': batch.time_ns,
+            'stat': batch.stat,
+            'freq': batch.freq,
+            'dfreq': batch.dfreq,
+            'mag': _concat(batch.mag, len(batch)),
+            'rad': _concat(batch.rad, len(batch)),
+            'analogs': _concat(batch.analogs, len(batch)),
+        }
+        start = max(len(batch) - capacity, 0)
+        seq = int(header[_WRITE_SEQ]) + start
+        while start < len(batch):
+            # write by pieces which do not wrap around the end of ring
+            pos = seq % capacity
+            end = min(len(batch), start + capacity - pos)
+            num = end - start
+            rows = slice(pos, pos + num)
+            header[_RESERVED_SEQ] = seq + num
+            seqs[rows] = -1
+            for name, column in columns.items():
+                self.__arrays[name][rows] = column[start:end]
+            seqs[rows] = np.arange(seq, seq + num)
+            seq += num
+            header[_WRITE_SEQ] = seq
+            start = end
+
+    def close(self):
+        """ Close and remove shared memory block. """
+        self.__ring = None
+        self.__arrays = None
+        self.shm.close()
+        # reader in process sharing resource tracker with the writer
+        # could unregister the block (see _attach)
+        resource_tracker.register(self.shm._name, 'shared_memory')
+        self.shm.unlink()
+
+
+class RingReader:
+    """ Reader of samples from shared memory ring.
+
+    Samples are returned as NumPy views of shared memory, so the writer
+    can overwrite them when it goes round the ring. Use
+    :meth:`is_valid` after processing the views to be sure they were not
+    overwritten. Samples which the reader has missed are counted in
+    ``overruns_num``. Views must be dropped before :meth:`close`.
+
+    :param name: Name of shared memory block
+    :type name: str
+    :param from_start: Read samples which are in the ring already,
+        otherwise only new ones
+    :type from_start: bool
+    """
+    def __init__(self, name, from_start=False):
+        self.shm = _attach(name)
+        header = np.ndarray((HEADER_FIELDS_NUM,), np.int64, self.shm.buf)
+        if header[_MAGIC] != MAGIC:
+            raise ValueError("Shared memory block is not PMU ring")
+        start = header.nbytes
+        conf_bytes = bytes(self.shm.buf[start:start+header[_CONF_SIZE]])
+        self.config_frame = ConfigFrame.fromBytes(conf_bytes)
+
+        self.__ring = _Ring(self.shm, self.config_frame,
+                            int(header[_CAPACITY]), len(conf_bytes))
+        self.__header = self.__ring.header
+        self.capacity = self.__ring.capacity
+        self.overruns_num = 0
+        self.__array_refs = []
+        self.read_seq = int(self.__header[_WRITE_SEQ])
+        if from_start:
+            self.read_seq = max(
+                int(self.__header[_RESERVED_SEQ]) - self.capacity, 0)
+
+    def station_columns(self, station_ind):
+        """ Return slices of phasor and analog columns of station.
+
+        :param station_ind: Index of station
+        :type station_ind: int
+        :return: Tuple (phasors slice, analogs slice)
+        """
+        stations = self.config_frame.stations
+        ph_start = sum(st.phnmr for st in stations[:station_ind])
+        an_start = sum(st.annmr for st in stations[:station_ind])
+        station = stations[station_ind]
+        return (slice(ph_start, ph_start + station.phnmr),
+                slice(an_start, an_start + station.annmr))
+
+    def available(self):
+        """ Return number of samples which are not read yet. """
+        return int(self.__header[_WRITE_SEQ]) - self.read_seq
+
+    def read(self, max_num=None):
+        """ Return new samples. Views do not wrap around the end of ring,
+        so the rest of samples is returned by the next call.
+
+        :param max_num: Max number of samples
+        :type max_num: int
+        :return: Tuple (sequence number of the first sample, dict of
+            views: seq, time_ns, stat, freq, dfreq, mag, rad, analogs)
+        """
+        write_seq = int(self.__header[_WRITE_SEQ])
+        oldest = int(self.__header[_RESERVED_SEQ]) - self.capacity
+        if self.read_seq < oldest:
+            self.overruns_num += oldest - self.read_seq
+            self.read_seq = oldest
+        num = write_seq - self.read_seq
+        if max_num is not None:
+            num = min(num, max_num)
+        pos = self.read_seq % self.capacity
+        num = min(num, self.capacity - pos)
+        first_seq = self.read_seq
+        self.read_seq += num
+        views = {
+            name: array[pos:pos+num]
+            for name, array in self.__ring.arrays.items()
+        }
+        return first_seq, views
+
+    def is_valid(self, seq):
+        """ Check that sample with sequence number seq (and the later
+        ones) were not overwritten by the writer. """
+        return seq >= int(self.__header[_RESERVED_SEQ]) - self.capacity
+
+    def close(self):
+        """ Detach from shared memory block. Views returned by
+        :meth:`read` point into the block and would be dangling after
+        it is unmapped (NumPy does not lock the buffer), so the caller
+        must drop them first. Otherwise BufferError is raised and close
+        can be called again after the views are dropped.
+
+        :raises BufferError: If views returned by :meth:`read` are alive
+        """
+        if self.__ring is not None:
+            # views keep arrays of the ring alive as their base
+            arrays = [self.__header, *self.__ring.arrays.values()]
+            self.__array_refs = [weakref.ref(array) for array in arrays]
+            del arrays
+            self.__ring = None
+            self.__header = None
+        if any(ref() is not None for ref in self.__array_refs):
+            raise BufferError("Views returned by RingReader.read() must "
+                              "be dropped before close()")
+        self.shm.close()
+
+
+def _concat(arrays, num):
+    arrays = [array for array in arrays if array.shape[1]]
+    if not arrays:
+        return np.empty((num, 0))
+    return np.concatenate(arrays, axis=1)
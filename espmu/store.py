@@ -0,0 +1,438 @@
+""" In this module the columnar on-disk store of decoded data is
+implemented. NumPy is required for this module.
+
+The store is a directory with the schema (``schema.json``, derived from
+the config frame) and chunk directories. Every chunk holds rows of one
+time interval, each column is kept in its own ``.npy`` file:
+
+* ``time_ns`` -- time of rows
+* ``s<i>_stat``, ``s<i>_freq``, ``s<i>_dfreq`` -- fields of station i
+* ``s<i>_ph<j>_mag``, ``s<i>_ph<j>_rad`` -- phasor j of station i
+* ``s<i>_an<j>`` -- analog value j of station i
+
+Chunk directories are named ``chunk-<first time>-<last time>`` (with
+``.<shard>`` suffix if the writer has shard name), so the chunks of
+time range are found by names, and reading one channel opens
+only its files (and ``time_ns``) of these chunks.
+
+Every chunk also has zone map (``zonemap.json``): number of rows, min
+and max of frequency, ROCOF and phasor magnitudes, bitwise OR of STAT
+words and number of rows with data error. Threshold queries use it to
+skip chunks which can not match.
+
+Columns can be compressed by :mod:`espmu.codec` (``compress=True`` of
+the writer), then they are kept in ``.pmz`` files instead of ``.npy``.
+The reader handles both, so chunks of both kinds can be mixed. """
+
+import json
+import os
+
+import numpy as np
+
+from espmu.codec import FLOATS, RLE, TIMES, decode_column, encode_column
+from espmu.decoding import find_index
+from espmu.pmuDataFrame import STAT_DATA_ERROR
+
+SCHEMA_FILE = "schema.json"
+CHUNK_PREFIX = "chunk-"
+CHUNK_DURATION = 600 * 10**9
+TIME_COLUMN = "time_ns"
+ZONE_MAP_FILE = "zonemap.json"
+COMPRESSED_EXT = ".pmz"
+
+
+def build_schema(config_frame):
+    """ Return schema (dict ready for JSON) of the store of data
+    described by config frame. """
+    stations = []
+    for i, station in enumerate(config_frame.stations):
+        stations.append({
+            'name': station.stn.strip(),
+            'idcode': station.idcode_data,
+            'cfgcnt': station.cfgcnt,
+            'phasors': [name.strip() for name in station.ph_channels],
+            'analogs': [name.strip() for name in station.an_channels],
+            'columns': _station_columns(i, station.phnmr, station.annmr),
+        })
+    return {
+        'idcode': config_frame.idcode,
+        'time_base': config_frame.time_base.baseDecStr,
+        'datarate': config_frame.datarate,
+        'stations': stations,
+    }
+
+
+def _station_columns(ind, phnmr, annmr):
+    columns = {
+        'stat': 's{}_stat'.format(ind),
+        'freq': 's{}_freq'.format(ind),
+        'dfreq': 's{}_dfreq'.format(ind),
+    }
+    for j in range(phnmr):
+        columns['ph{}_mag'.format(j)] = 's{}_ph{}_mag'.format(ind, j)
+        columns['ph{}_rad'.format(j)] = 's{}_ph{}_rad'.format(ind, j)
+    for j in range(annmr):
+        columns['an{}'.format(j)] = 's{}_an{}'.format(ind, j)
+    return columns
+
+
+class ColumnStoreWriter:
+    """ Writer of decoded data frames into columnar store.
+
+    Rows are collected in memory and written when the chunk interval
+    is over (or on :meth:`flush`).
+
+    :param directory: Directory of the store
+    :type directory: str
+    :param config_frame: Config frame of data source
+    :type config_frame: ConfigFrame
+    :param chunk_duration: Time interval (nanoseconds) of chunk
+    :type chunk_duration: int
+    :param compress: Compress columns by :mod:`espmu.codec`
+    :type compress: bool
+    :param shard: Name added to names of chunks, so writers of
+        different shards (e.g. processes) writing into the same store
+        at once do not take the same names
+    :type shard: str
+    """
+    def __init__(self, directory, config_frame,
+                 chunk_duration=CHUNK_DURATION, compress=False, shard=None):
+        self.directory = directory
+        self.chunk_duration = chunk_duration
+        self.compress = compress
+        self.shard = shard
+        self.schema = build_schema(config_frame)
+        self.chunks_num = 0
+
+        os.makedirs(directory, exist_ok=True)
+        schema_path = os.path.join(directory, SCHEMA_FILE)
+        if os.path.exists(schema_path):
+            with open(schema_path) as file:
+                if json.load(file) != self.schema:
+                    raise ValueError(
+                        "Store {} has another schema".format(directory))
+        else:
+            with open(schema_path, 'w') as file:
+                json.dump(self.schema, file, indent=1)
+
+        self.__parts = []
+        self.__chunk = None
+
+    def append(self, batch):
+        """ Append decoded data frames.
+
+        :param batch: Decoded data frames
+        :type batch: :class:`espmu.batch.BatchData`
+        """
+        if not len(batch):
+            return
+        chunks = batch.time_ns // self.chunk_duration
+        bounds = np.flatnonzero(np.diff(chunks)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(batch)]))
+        for start, end in zip(starts, ends):
+            if self.__chunk is not None and self.__chunk != chunks[start]:
+                self.flush()
+            self.__chunk = chunks[start]
+            self.__parts.append(_columns(batch, slice(start, end)))
+
+    def flush(self):
+        """ Write collected rows as chunk. """
+        if not self.__parts:
+            return
+        columns = {
+            name: np.concatenate([part[name] for part in self.__parts])
+            for name in self.__parts[0]
+        }
+        self.__parts = []
+        self.__chunk = None
+
+        order = np.argsort(columns[TIME_COLUMN], kind='stable')
+        if np.any(order[1:] < order[:-1]):
+            columns = {name: column[order] for name, column in
+                       columns.items()}
+        times = columns[TIME_COLUMN]
+        path = os.path.join(self.directory, "{}{}-{}".format(
+            CHUNK_PREFIX, times[0], times[-1]))
+        if self.shard is not None:
+            path += ".{}".format(self.shard)
+        tmp_path = path + ".tmp"
+        while True:
+            # directory is created atomically, so it is taken by one
+            # writer only
+            try:
+                os.mkdir(tmp_path)
+                break
+            except FileExistsError:
+                tmp_path = tmp_path[:-len(".tmp")] + "_.tmp"
+        for name, column in columns.items():
+            if self.compress:
+                with open(os.path.join(tmp_path, name + COMPRESSED_EXT),
+                          'wb') as file:
+                    file.write(encode_column(column, _method(name)))
+            else:
+                np.save(os.path.join(tmp_path, name + ".npy"), column)
+        with open(os.path.join(tmp_path, ZONE_MAP_FILE), 'w') as file:
+            json.dump(_zone_map(columns), file)
+        while True:
+            # renaming fails if the chunk is there already
+            try:
+                os.rename(tmp_path, path)
+                break
+            except OSError:
+                if not os.path.exists(path):
+                    raise
+                path += "_"  # rows of the same time range were written
+        self.chunks_num += 1
+
+    def close(self):
+        """ Write the rest of rows. """
+        self.flush()
+
+
+def _columns(batch, rows):
+    columns = {TIME_COLUMN: batch.time_ns[rows]}
+    for i in range(batch.stat.shape[1]):
+        columns['s{}_stat'.format(i)] = batch.stat[rows, i]
+        columns['s{}_freq'.format(i)] = batch.freq[rows, i]
+        columns['s{}_dfreq'.format(i)] = batch.dfreq[rows, i]
+        for j in range(batch.mag[i].shape[1]):
+            columns['s{}_ph{}_mag'.format(i, j)] = batch.mag[i][rows, j]
+            columns['s{}_ph{}_rad'.format(i, j)] = batch.rad[i][rows, j]
+        for j in range(batch.analogs[i].shape[1]):
+            columns['s{}_an{}'.format(i, j)] = batch.analogs[i][rows, j]
+    return columns
+
+
+def _method(name):
+    if name == TIME_COLUMN:
+        return TIMES
+    if name.endswith('_stat'):
+        return RLE
+    return FLOATS
+
+
+def _load_column(path, name, mmap_mode=None):
+    compressed = os.path.join(path, name + COMPRESSED_EXT)
+    if os.path.exists(compressed):
+        with open(compressed, 'rb') as file:
+            return decode_column(file.read())
+    return np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+
+
+def _zone_map(columns):
+    zone_map = {'count': len(columns[TIME_COLUMN])}
+    for name, column in columns.items():
+        if name.endswith(('_freq', '_dfreq', '_mag')):
+            valid = column[~np.isnan(column)]
+            zone_map[name] = {
+                'min': float(valid.min()) if len(valid) else None,
+                'max': float(valid.max()) if len(valid) else None,
+                'count': len(valid),
+            }
+        elif name.endswith('_stat'):
+            zone_map[name] = {
+                'or': int(np.bitwise_or.reduce(column)),
+                'errors': int(np.count_nonzero(column & STAT_DATA_ERROR)),
+            }
+    return zone_map
+
+
+class ColumnStoreReader:
+    """ Reader of columnar store.
+
+    :param directory: Directory of the store
+    :type directory: str
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, SCHEMA_FILE)) as file:
+            self.schema = json.load(file)
+        self.scanned_num = 0
+        self.skipped_num = 0
+
+    def chunks(self, start_ns=None, end_ns=None):
+        """ Return list of tuples (path, first time, last time) of chunks
+        which can contain rows of time range, ordered by time. """
+        res = []
+        for name in os.listdir(self.directory):
+            if not name.startswith(CHUNK_PREFIX) or name.endswith(".tmp"):
+                continue
+            bounds = name[len(CHUNK_PREFIX):].split(".")[0].rstrip("_")
+            first, last = bounds.split("-")
+            first, last = int(first), int(last)
+            if start_ns is not None and last < start_ns:
+                continue
+            if end_ns is not None and first > end_ns:
+                continue
+            res.append((os.path.join(self.directory, name), first, last))
+        res.sort(key=lambda chunk: chunk[1])
+        return res
+
+    def column_name(self, station, channel):
+        """ Return name of column file.
+
+        :param station: Station name or index
+        :type station: str/int
+        :param channel: ``stat``, ``freq``, ``dfreq``, name or index of
+            analog channel, or name or index of phasor channel with
+            suffix ``.mag`` or ``.rad`` (``.mag`` is default)
+        :type channel: str/int
+        """
+        stations = self.schema['stations']
+        st_info = stations[
+            find_index([st['name'] for st in stations], station)]
+        columns = st_info['columns']
+        if channel in ('stat', 'freq', 'dfreq'):
+            return columns[channel]
+
+        part = 'mag'
+        if isinstance(channel, str) and channel.endswith(('.mag', '.rad')):
+            channel, part = channel[:-4], channel[-3:]
+        names = st_info['phasors'] + st_info['analogs']
+        ind = find_index(names, channel)
+        if ind < len(st_info['phasors']):
+            return columns['ph{}_{}'.format(ind, part)]
+        return columns['an{}'.format(ind - len(st_info['phasors']))]
+
+    def read(self, station, channel, start_ns=None, end_ns=None):
+        """ Read values of channel in time range.
+
+        :param station: Station name or index
+        :type station: str/int
+        :param channel: Channel (see :meth:`column_name`)
+        :type channel: str/int
+        :param start_ns: Start time (nanoseconds), None means from the
+            beginning
+        :type start_ns: int
+        :param end_ns: End time (nanoseconds, inclusive), None means up
+            to the end
+        :type end_ns: int
+
+        :return: Tuple of arrays (time_ns, values)
+        """
+        return self.read_columns(
+            [self.column_name(station, channel)], start_ns, end_ns)
+
+    def read_columns(self, names, start_ns=None, end_ns=None):
+        """ Read columns by names of their files in time range.
+
+        :return: Tuple of arrays (time_ns, column, ...)
+        """
+        parts = [[] for _ in range(len(names) + 1)]
+        for path, first, last in self.chunks(start_ns, end_ns):
+            times = _load_column(path, TIME_COLUMN, 'r')
+            start = 0 if start_ns is None or first >= start_ns else \
+                np.searchsorted(times, start_ns, 'left')
+            end = len(times) if end_ns is None or last <= end_ns else \
+                np.searchsorted(times, end_ns, 'right')
+            if start >= end:
+                continue
+            parts[0].append(np.array(times[start:end]))
+            for k, name in enumerate(names):
+                column = _load_column(path, name, 'r')
+                parts[k + 1].append(np.array(column[start:end]))
+        return tuple(
+            np.concatenate(part) if part else np.empty(0) for part in parts)
+
+    def zone_map(self, path):
+        """ Return zone map of chunk or None if the chunk has no zone map
+        (written before zone maps were added). """
+        try:
+            with open(os.path.join(path, ZONE_MAP_FILE)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def find_outside(self, channel, low, high, station=None, start_ns=None,
+                     end_ns=None):
+        """ Find values of channel which are out of range [low, high],
+        for example, ``find_outside('freq', 59.95, 60.05)``. Chunks whose
+        values are all in range (by zone map) are not read.
+
+        :param channel: ``freq``, ``dfreq`` or phasor channel (its
+            magnitude), see :meth:`column_name`
+        :type channel: str/int
+        :param low: Low bound
+        :type low: float
+        :param high: High bound
+        :type high: float
+        :param station: Station name or index, None means all stations
+        :type station: str/int
+
+        :return: Dict from station name to tuple of arrays (time_ns,
+            values)
+        """
+        def may_match(stats):
+            return stats['count'] and (stats['min'] < low or
+                                       stats['max'] > high)
+
+        def select(values):
+            return (values < low) | (values > high)
+
+        res = {}
+        for st_name in self.__station_names(station):
+            column = self.column_name(st_name, channel)
+            if not column.endswith(('_freq', '_dfreq', '_mag')):
+                raise ValueError("No zone map for {}".format(channel))
+            res[st_name] = self.__scan(column, may_match, select,
+                                       start_ns, end_ns)
+        return res
+
+    def find_stat(self, mask=STAT_DATA_ERROR, station=None, start_ns=None,
+                  end_ns=None):
+        """ Find rows whose STAT word has any of bits of mask set.
+        Chunks where these bits are never set (by zone map) are not
+        read.
+
+        :param mask: Bits of STAT (see ``STAT_*`` in
+            :mod:`espmu.pmuDataFrame`)
+        :type mask: int
+        :param station: Station name or index, None means all stations
+        :type station: str/int
+
+        :return: Dict from station name to tuple of arrays (time_ns,
+            STAT words)
+        """
+        def may_match(stats):
+            return stats['or'] & mask
+
+        def select(values):
+            return (values & mask) != 0
+
+        res = {}
+        for st_name in self.__station_names(station):
+            column = self.column_name(st_name, 'stat')
+            res[st_name] = self.__scan(column, may_match, select,
+                                       start_ns, end_ns)
+        return res
+
+    def __station_names(self, station):
+        stations = self.schema['stations']
+        if station is None:
+            return [st['name'] for st in stations]
+        return [stations[
+            find_index([st['name'] for st in stations], station)]['name']]
+
+    def __scan(self, column, may_match, select, start_ns, end_ns):
+        times = []
+        values = []
+        for path, first, last in self.chunks(start_ns, end_ns):
+            zone_map = self.zone_map(path)
+            # chunk without zone map is scanned
+            if zone_map is not None and not may_match(zone_map[column]):
+                self.skipped_num += 1
+                continue
+            self.scanned_num += 1
+            chunk_times = _load_column(path, TIME_COLUMN)
+            chunk_values = _load_column(path, column)
+            rows = select(chunk_values)
+            if start_ns is not None and first < start_ns:
+                rows &= chunk_times >= start_ns
+            if end_ns is not None and last > end_ns:
+                rows &= chunk_times <= end_ns
+            times.append(chunk_times[rows])
+            values.append(chunk_values[rows])
+        if not times:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        return np.concatenate(times), np.concatenate(values)
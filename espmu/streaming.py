@@ -1,8 +1,55 @@
 """ This module implements the class for high-level interaction with
 number of PMUs (stations) whithin PDC. """
 
+import threading
+import time
+
 from espmu import tools as pt
+from espmu.buffering import BUFFER_SIZE, FrameBuffer
 from espmu.client import Client
+from espmu.decoding import DecodePlan, Projection
+from espmu.pmuConfigFrame import ConfigFrame
+from espmu.pmuDataFrame import STAT_CONFIG_CHANGE
+from espmu.pmuEnum import BufferPolicy, FrameType
+from espmu.pmuFrame import HEADER_STRUCT, NS_IN_SEC
+
+CONFIG_ATTEMPTS = 10
+
+
+def request_config_frame(cli, idcode, attempts=CONFIG_ATTEMPTS):
+    """ Turn data off and request config frame 2 until it is received.
+    Frames are read by :meth:`espmu.client.Client.readFrame`, so data
+    frames which were sent before DATAOFF are dropped instead of being
+    taken for a wrong answer. The next request is sent if the socket
+    times out or the source answers with other frame.
+
+    :param cli: Client connected to data source
+    :type cli: Client
+    :param idcode: Frame ID of data source
+    :type idcode: int
+    :param attempts: Max number of CONFIG2 requests
+    :type attempts: int
+
+    :return: Config frame or None if it is not received
+
+    :raises ConnectionError: If the connection is closed by data source
+    :raises ValueError: If the stream is not synchronized
+    """
+    pt.turnDataOff(cli, idcode)
+    timeout = cli.theSocket.gettimeout()
+    for _ in range(attempts):
+        pt.requestConfigFrame2(cli, idcode)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while deadline is None or time.monotonic() < deadline:
+            frame = cli.readFrame()
+            if frame is None:  # socket timed out
+                break
+            frame_type = (frame[1] >> 4) & 7
+            if frame_type == FrameType.Config2.value:
+                return ConfigFrame.fromBytes(bytes(frame))
+            if frame_type != FrameType.Data.value:
+                break
+    return None
 
 
 class PmuStreamDataReader:
@@ -14,35 +61,43 @@ class PmuStreamDataReader:
         self.__data_on = False
         self.__output_settings = []
         self.__conf_frame = None
+        self.__projection = None
+        self.__station_projections = {}
+        self.__buffer = None
+        self.__receiver = None
+        self.receive_error = None
 
-    def connect(self, ip_addr, tcp_port, idcode):
-        """ Connect to PDC or PMU. """
+    def connect(self, ip_addr, tcp_port, idcode,
+                config_attempts=CONFIG_ATTEMPTS):
+        """ Connect to PDC or PMU. Return False if connection fails or
+        config frame is not received after config_attempts requests. """
         self.__idcode = idcode
         self.__cli = Client(ip_addr, tcp_port, proto="TCP")
         self.__cli.setTimeout(5)
         if not self.__cli.connectToDest():
             return False
-        pt.turnDataOff(self.__cli, idcode)
-
-        while True:
-            pt.requestConfigFrame2(self.__cli, idcode)
 
-            answer = pt.readConfigFrame2(self.__cli)
-
-            if answer is None:
-                continue
-
-            if not answer:
-                return False
-
-            self.__conf_frame = answer
-            break
+        try:
+            answer = request_config_frame(self.__cli, idcode,
+                                          config_attempts)
+        except (OSError, ValueError):
+            answer = None
+        if answer is None:
+            return False
+        self.__conf_frame = answer
 
         self.__output_settings = [None]*self.__conf_frame.num_pmu
+        self.__projection = None
+        self.__station_projections = {}
         return True
 
     def disconnect(self):
         """ Disconnect from PDC or PMU. """
+        if self.__buffer is not None:
+            self.__buffer.close()
+            self.__receiver.join()
+            self.__buffer = None
+            self.__receiver = None
         if self.__cli:
             self.__cli.stop()
             self.__cli = None
@@ -63,6 +118,32 @@ class PmuStreamDataReader:
         pt.turnDataOn(self.__cli, self.__idcode)
         self.__data_on = True
 
+    def start_buffering(self, size=BUFFER_SIZE, policy=BufferPolicy.BLOCK,
+                        fps=None):
+        """ Start receiving data frames in separate thread into bounded
+        buffer, so consumer does not stall the data source. After that
+        :meth:`get_selected_samples` and :meth:`get_full_samples` take
+        frames from the buffer.
+
+        :param size: Max number of frames in buffer
+        :type size: int
+        :param policy: What to do when the buffer is full (see
+            :class:`espmu.buffering.FrameBuffer`)
+        :type policy: BufferPolicy
+        :param fps: Rate of frames for DECIMATE policy
+        :type fps: int
+
+        :return: Buffer with counters of shed frames
+        :rtype: FrameBuffer
+        """
+        self.__buffer = FrameBuffer(
+            size, policy, fps, self.__conf_frame.time_base.baseDecStr)
+        self.receive_error = None
+        self.__receiver = threading.Thread(target=self.__receive,
+                                           daemon=True)
+        self.__receiver.start()
+        return self.__buffer
+
     def stations(self):
         """ Return the names of stations. """
         if not self.__conf_frame:
@@ -95,33 +176,272 @@ class PmuStreamDataReader:
             res.append(an_name.replace(" ", ""))
         return res
 
+    def select(self, selection):
+        """ Register stations and channels which are needed. Only they
+        will be decoded by :meth:`get_selected_samples`.
+
+        :param selection: Mapping from station (name or index) to the
+            list of phasor and analog channels (names or indexes), None
+            instead of list selects all channels
+        :type selection: dict
+        """
+        self.__projection = Projection(self.__conf_frame, selection)
+
+    def get_selected_samples(self):
+        """ Return list of samples containing selected channels only.
+
+        :rtype: list of :class:`espmu.decoding.ProjectedFrame`
+        """
+        return [
+            self.__projection.decode(frame)
+            for frame in self.__read_frames()
+        ]
+
     def get_full_samples(self, station_ind):
         """ Return list of samples. """
-        data_sample = pt.getDataSample(self.__cli)
-        data_frames = pt.get_data_frames(data_sample, self.__conf_frame)
+        projection = self.__station_projections.get(station_ind)
+        if projection is None:
+            projection = Projection(self.__conf_frame, {station_ind: None})
+            self.__station_projections[station_ind] = projection
+
         samples = []
-        for data_frame in data_frames:
-            station = data_frame.pmus[station_ind]
-            secs = data_frame.soc.secCount
-            msecs = data_frame.fracsec
-            msecs = msecs / data_frame.configFrame.time_base.baseDecStr
+        for frame in self.__read_frames():
+            data_frame = projection.decode(frame)
+            station = data_frame.stations[0]
 
             sample = []
 
             # 0 - time
-            sample.append(secs + msecs)
+            sample.append(data_frame.utcSec)
 
             # 1 - freq
             sample.append(station.freq)
 
             # then phasors
-            for phasor in station.phasors:
-                sample.append((phasor.mag, phasor.rad))
+            sample.extend(station.phasors)
 
             # and analogs
-            for analog in station.analogs:
-                sample.append(analog[1])
+            sample.extend(station.analogs)
 
             samples.append(sample)
 
         return samples
+
+    def __read_frames(self):
+        if self.__buffer is None:
+            return pt.split_frames(pt.readDataSample(self.__cli))
+        return self.__buffer.get_all(timeout=self.__cli.theSocket.gettimeout())
+
+    def __receive(self):
+        try:
+            while not self.__buffer.is_closed():
+                for frame in self.__cli.readFrames():
+                    if (frame[1] >> 4) & 7 == FrameType.Data.value:
+                        self.__buffer.put(frame)
+        except (OSError, ValueError) as exc:
+            self.receive_error = exc
+        self.__buffer.close()
+
+
+class SupervisedStreamDataReader:
+    """ Data reader which survives restarts of data source.
+
+    Stalls (no data during stall_timeout) and socket errors are
+    detected, then the reader reconnects with exponential backoff.
+    After reconnection data is turned on at once if the last config
+    frame is still valid (the first data frame has expected size and no
+    configuration change flag), otherwise config frame is requested
+    again and the last one is kept if CFGCNT of stations did not change.
+
+    Metrics: ``reconnects_num`` (connections made after the first one),
+    ``last_gap_sec`` and ``total_gap_sec`` (time between the last frame
+    before the failure and the first frame after reconnection, counted
+    by frame timestamps).
+
+    :param ip_addr: IP address of data source
+    :type ip_addr: str
+    :param tcp_port: TCP port of data source
+    :type tcp_port: int
+    :param idcode: Frame ID of data source
+    :type idcode: int
+    :param stall_timeout: Time (seconds) without data which is
+        considered as stall
+    :type stall_timeout: float
+    :param backoff_min: First delay (seconds) before reconnection
+    :type backoff_min: float
+    :param backoff_max: Max delay (seconds) before reconnection
+    :type backoff_max: float
+    :param config_attempts: Max number of CONFIG2 requests per connection
+    :type config_attempts: int
+    """
+    def __init__(self, ip_addr, tcp_port, idcode, stall_timeout=5,
+                 backoff_min=0.5, backoff_max=30,
+                 config_attempts=CONFIG_ATTEMPTS):
+        self.ip_addr = ip_addr
+        self.tcp_port = tcp_port
+        self.idcode = idcode
+        self.stall_timeout = stall_timeout
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.config_attempts = config_attempts
+
+        self.reconnects_num = 0
+        self.last_gap_sec = 0.0
+        self.total_gap_sec = 0.0
+        self.last_error = None
+
+        self.__cli = None
+        self.__conf_frame = None
+        self.__selection = None
+        self.__projection = None
+        self.__last_time_ns = None
+        self.__gap_start_ns = None
+        self.__pending = None
+        self.__closed = False
+
+    def config_frame(self):
+        """ Return the last config frame. """
+        return self.__conf_frame
+
+    def select(self, selection):
+        """ Register stations and channels to be decoded by
+        :meth:`get_selected_samples` (see
+        :meth:`PmuStreamDataReader.select`). """
+        self.__selection = selection
+        self.__projection = None
+
+    def read_frame(self):
+        """ Return next data frame, reconnecting as many times as needed.
+
+        :return: Memoryview of data frame which is valid until the next
+            call, or None if the reader is closed
+        """
+        while not self.__closed:
+            if self.__cli is None:
+                self.__reconnect()
+                continue
+            frame = self.__pending
+            self.__pending = None
+            try:
+                if frame is None:
+                    frame = self.__cli.readFrame()
+                if frame is None:
+                    raise TimeoutError("No data during stall timeout")
+            except (OSError, ValueError) as exc:
+                self.__fail(exc)
+                continue
+            if (frame[1] >> 4) & 7 != FrameType.Data.value:
+                continue
+            self.__account(frame)
+            return frame
+        return None
+
+    def get_selected_samples(self):
+        """ Return list with the next sample containing selected channels
+        (all channels if :meth:`select` was not called).
+
+        :rtype: list of :class:`espmu.decoding.ProjectedFrame`
+        """
+        frame = self.read_frame()
+        if frame is None:
+            return []
+        if self.__projection is None:
+            selection = self.__selection
+            if selection is None:
+                selection = {ind: None for ind in
+                             range(self.__conf_frame.num_pmu)}
+            self.__projection = Projection(self.__conf_frame, selection)
+        return [self.__projection.decode(frame)]
+
+    def close(self):
+        """ Turn data off and disconnect. """
+        self.__closed = True
+        if self.__cli is not None:
+            try:
+                pt.turnDataOff(self.__cli, self.idcode)
+            except OSError:
+                pass
+            self.__disconnect()
+
+    def __account(self, frame):
+        _, _, _, soc, fracsec = HEADER_STRUCT.unpack_from(frame)
+        time_base = self.__conf_frame.time_base.baseDecStr
+        time_ns = soc * NS_IN_SEC + \
+            (fracsec & 0xFFFFFF) * NS_IN_SEC // time_base
+        if self.__gap_start_ns is not None:
+            gap_ns = max(time_ns - self.__gap_start_ns, 0)
+            self.last_gap_sec = gap_ns / NS_IN_SEC
+            self.total_gap_sec += self.last_gap_sec
+            self.__gap_start_ns = None
+        self.__last_time_ns = time_ns
+
+    def __fail(self, exc):
+        self.last_error = exc
+        self.__disconnect()
+        if self.__gap_start_ns is None:
+            self.__gap_start_ns = self.__last_time_ns
+
+    def __disconnect(self):
+        self.__pending = None
+        if self.__cli is not None:
+            self.__cli.stop()
+            self.__cli = None
+
+    def __reconnect(self):
+        delay = self.backoff_min
+        while not self.__closed:
+            if self.__connect():
+                return
+            time.sleep(delay)
+            delay = min(2*delay, self.backoff_max)
+
+    def __connect(self):
+        cli = Client(self.ip_addr, self.tcp_port, proto="TCP")
+        cli.setTimeout(self.stall_timeout)
+        if not cli.connectToDest():
+            cli.stop()
+            return False
+        self.__cli = cli
+        if self.__conf_frame is not None:
+            self.reconnects_num += 1
+        try:
+            if self.__conf_frame is not None and self.__resume():
+                return True
+            conf_frame = request_config_frame(
+                cli, self.idcode, self.config_attempts)
+            if conf_frame is None:
+                raise TimeoutError("No config frame")
+            self.__set_config_frame(conf_frame)
+            pt.turnDataOn(cli, self.idcode)
+        except (OSError, ValueError) as exc:
+            self.last_error = exc
+            self.__disconnect()
+            return False
+        return True
+
+    def __resume(self):
+        pt.turnDataOn(self.__cli, self.idcode)
+        frame = self.__cli.readFrame()
+        if frame is None or (frame[1] >> 4) & 7 != FrameType.Data.value:
+            return False
+        plan = DecodePlan.for_config(self.__conf_frame)
+        if (frame[2] << 8) | frame[3] != plan.framesize:
+            return False
+        for station_plan in plan.stations:
+            stat_pos = station_plan.offset
+            if frame[stat_pos] << 8 & STAT_CONFIG_CHANGE:
+                return False
+        self.__pending = frame
+        return True
+
+    def __set_config_frame(self, conf_frame):
+        if self.__conf_frame is not None:
+            # layout of data frames is kept while CFGCNT of every
+            # station is the same
+            old_counts = [station.cfgcnt
+                          for station in self.__conf_frame.stations]
+            new_counts = [station.cfgcnt for station in conf_frame.stations]
+            if old_counts == new_counts:
+                return
+        self.__conf_frame = conf_frame
+        self.__projection = None
@@ -2,10 +2,11 @@
 parsing PMU data."""
 
 from espmu.client import Client
+from espmu.framer import MIN_FRAME_SIZE, SYNC_BYTE
 from espmu.pmuConfigFrame import ConfigFrame
 from espmu.pmuCommandFrame import CommandFrame
 from espmu.pmuLib import bytesToHexStr
-from espmu.pmuDataFrame import DataFrame
+from espmu.pmuDataFrame import DataFrame, LazyDataFrame
 
 MAXFRAMESIZE = 65535
 
@@ -62,7 +63,7 @@ def readConfigFrame2(cli, debug=False):
 
     """
     leading_byte = cli.readSample(1)
-    if leading_byte == "":  # can't get sample at all
+    if not leading_byte:  # can't get sample at all
         return False
     if leading_byte[0] != 170:  # wrong synchronization word
         return None
@@ -71,9 +72,11 @@ def readConfigFrame2(cli, debug=False):
         return None
     config_frame = ConfigFrame(bytesToHexStr(sample), debug)
     exp_size = config_frame.framesize
-    sample = cli.readSample(exp_size - 4)
-    config_frame.frame = config_frame.frame + bytesToHexStr(sample).upper()
+    rest = cli.readSample(exp_size - 4)
+    config_frame.frame = config_frame.frame + bytesToHexStr(rest).upper()
     config_frame.finishParsing()
+    if cli.recorder is not None:
+        cli.recorder.write(sample + rest)
     return config_frame
 
 
@@ -86,26 +89,73 @@ def getDataSample(rcvr):
     :return: Data frame in hex string format
     """
 
-    full_hex_str = ""
-    if type(rcvr) == "client":
-        intro_hex_str = bytesToHexStr(rcvr.readSample(4))
-        len_to_read = int(intro_hex_str[5:], 16)
-        rest_hex_str = bytesToHexStr(rcvr.readSample(len_to_read))
-        full_hex_str = intro_hex_str + rest_hex_str
-    else:
-        full_hex_str = bytesToHexStr(rcvr.readSample(64000))
+    return bytesToHexStr(readDataSample(rcvr))
 
-    return full_hex_str
+
+def readDataSample(rcvr):
+    """
+    Get a data sample as raw bytes regardless of TCP or UDP connection.
+    Exactly one frame is read from TCP client.
+
+    :param rcvr: Object used for receiving data frames
+    :type rcvr: :class:`Client`/:class:`Server`
+    :return: Data frame bytes, empty bytes if socket timed out
+    """
+
+    if isinstance(rcvr, Client):
+        sample = rcvr.readFrame()
+        return b"" if sample is None else bytes(sample)
+    return rcvr.readSample(64000)
 
 
-def get_data_frames(data_sample, conf_frame):
-    """ Return list of data frames from data_sample. """
+def split_frames(data_sample):
+    """ Split bytes into frames walking FRAMESIZE fields. Frames are
+    returned as views of the same buffer, nothing is copied.
+
+    :param data_sample: Buffer containing concatenated frames
+    :type data_sample: bytes/bytearray/memoryview
+
+    :return: Generator of memoryview objects, one for each frame
+
+    :raises ValueError: If the buffer contains unsynchronized or
+        truncated frame
+    """
+
+    view = memoryview(data_sample)
+    size = len(view)
+    start_pos = 0
+    while start_pos < size:
+        if size - start_pos < 4 or view[start_pos] != SYNC_BYTE:
+            raise ValueError("No frame at position {}".format(start_pos))
+        framesize = (view[start_pos+2] << 8) | view[start_pos+3]
+        end_pos = start_pos + framesize
+        if framesize < MIN_FRAME_SIZE or end_pos > size:
+            raise ValueError(
+                "Wrong size of frame at position {}".format(start_pos))
+        yield view[start_pos:end_pos]
+        start_pos = end_pos
+
+
+def get_data_frames(data_sample, conf_frame, lazy=False):
+    """ Return list of data frames from data_sample. The sample can
+    be either hex string or bytes. In the last case frames are parsed
+    directly from bytes, and if lazy is True the fields of frames are
+    decoded on demand (see :class:`LazyDataFrame`). Frames keep views
+    of data_sample only if it is bytes, other buffers are copied. """
+
+    if not isinstance(data_sample, str):
+        create_frame = LazyDataFrame if lazy else DataFrame.fromBytes
+        return [
+            create_frame(frame, conf_frame)
+            for frame in split_frames(data_sample)
+        ]
 
     data_frames = []
     start_pos = 0
     while True:
-        tail = data_sample[start_pos:]
-        data_frame = DataFrame(tail, conf_frame)
+        framesize = int(data_sample[start_pos+4:start_pos+8], 16)
+        frame = data_sample[start_pos:start_pos+2*framesize]
+        data_frame = DataFrame(frame, conf_frame)
         data_frames.append(data_frame)
         start_pos += data_frame.parse_pos
         if start_pos >= len(data_sample):
@@ -174,10 +224,8 @@ def parseSamples(data, config_frame, pmus):
     for s in range(num_of_samples):
         for p in range(len(data[s].pmus)):
             for phasor in range(len(data[s].pmus[p].phasors)):
-                msec = (data[s].fracsec / config_frame.time_base.baseDecStr)
-                utc_timestamp = data[s].soc.utcSec + msec
                 pmus[p][phasor].addSample(
-                    utc_timestamp,
+                    data[s].soc.utcSec,
                     data[s].pmus[p].phasors[phasor].mag,
                     data[s].pmus[p].phasors[phasor].rad)
 
@@ -32,10 +32,7 @@ class TransferFrame():
     def parseDataSample(self):
         """Parse the input data sample"""
         self.length += len(self.header) / 2  # Separator
-        tmp = self.dataFrame.fracsec
-        tmp = tmp / self.dataFrame.configFrame.time_base.baseDecStr
-        tmp += self.dataFrame.soc.utcSec
-        self.timestamp = tmp
+        self.timestamp = self.dataFrame.soc.utcSec
         self.parsePhasors()
 
         self.length += len(pack('d', self.timestamp))  # Double
@@ -26,9 +26,11 @@ setup(
         'Topic :: Scientific/Engineering :: Interface Engine/Protocol Translator',
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
         'Environment :: MacOS X',
         'Environment :: Win32 (MS Windows)',
         'Environment :: Console'
@@ -36,5 +38,9 @@ setup(
 
     keywords='development PMU Phasor',
     packages=find_packages(exclude=['contrib', 'docs', 'tests']),
+    python_requires='>=3.8',
     install_requires=['pythoncrc'],
+    extras_require={
+        'numpy': ['numpy'],
+    },
 )
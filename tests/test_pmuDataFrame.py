@@ -0,0 +1,54 @@
+""" Tests of :mod:`espmu.pmuDataFrame`. """
+
+import binascii
+import struct
+import unittest
+
+from espmu.pmuConfigFrame import ConfigFrame
+from espmu.pmuDataFrame import DataFrame, LazyDataFrame, Stat
+from espmu.pmuLib import bytesToHexStr
+
+STAT_WORD = 0x8C25
+
+
+def finish_frame(sync, body):
+    """ Add SYNC, FRAMESIZE and CHK to body of frame. """
+    frame = struct.pack('!HH', sync, len(body) + 6) + body
+    return frame + struct.pack('!H', binascii.crc_hqx(frame, 0xFFFF))
+
+
+def config_frame():
+    """ Config frame 2 of one station with one integer phasor. """
+    body = struct.pack('!HIIIH', 7, 1600000000, 0, 1000000, 1)
+    body += b'STATION A'.ljust(16)
+    body += struct.pack('!HHHHH', 11, 0, 1, 0, 0)
+    body += b'PH0'.ljust(16)
+    body += struct.pack('!IHHh', 915527, 0, 1, 50)
+    return finish_frame(0xAA31, body)
+
+
+def data_frame():
+    """ Data frame matching :func:`config_frame`. """
+    body = struct.pack('!HIIHhhhh', 7, 1600000000, 0, STAT_WORD,
+                       100, 0, 0, 0)
+    return finish_frame(0xAA01, body)
+
+
+class TestStat(unittest.TestCase):
+
+    def test_same_stat_from_hex_and_bytes(self):
+        conf = ConfigFrame.fromBytes(config_frame())
+        frame = data_frame()
+        stats = [
+            DataFrame(bytesToHexStr(frame), conf).pmus[0].stat,
+            DataFrame.fromBytes(frame, conf).pmus[0].stat,
+            LazyDataFrame(frame, conf).pmus[0].stat,
+        ]
+        for stat in stats:
+            self.assertIsInstance(stat, Stat)
+            self.assertEqual(vars(stat), vars(stats[0]))
+        self.assertEqual(stats[0].word, STAT_WORD)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+""" Tests of :mod:`espmu.streaming` against fake PDC. """
+
+import binascii
+import socket
+import struct
+import threading
+import unittest
+
+from espmu.streaming import SupervisedStreamDataReader
+
+IDCODE = 7
+TIME_BASE = 1000000
+RATE = 50
+CMD_DATAOFF = 1
+CMD_DATAON = 2
+CMD_CONFIG2 = 5
+
+
+def finish_frame(sync, body):
+    """ Add SYNC, FRAMESIZE and CHK to body of frame. """
+    frame = struct.pack('!HH', sync, len(body) + 6) + body
+    return frame + struct.pack('!H', binascii.crc_hqx(frame, 0xFFFF))
+
+
+def config_frame(cfgcnt, phasors_num):
+    """ Config frame 2 of one station with integer phasors. """
+    body = struct.pack('!HIIIH', IDCODE, 1600000000, 0, TIME_BASE, 1)
+    body += b'STATION A'.ljust(16)
+    body += struct.pack('!HHHHH', 11, 0, phasors_num, 0, 0)
+    for ind in range(phasors_num):
+        body += 'PH{}'.format(ind).encode().ljust(16)
+    body += struct.pack('!I', 915527) * phasors_num
+    body += struct.pack('!HHh', 0, cfgcnt, RATE)
+    return finish_frame(0xAA31, body)
+
+
+def data_frame(ind, phasors_num, stat=0):
+    """ Data frame matching :func:`config_frame`. """
+    body = struct.pack('!HII', IDCODE, 1600000000 + ind // RATE,
+                       (ind % RATE) * TIME_BASE // RATE)
+    body += struct.pack('!H', stat)
+    body += struct.pack('!hh', 100, 0) * phasors_num
+    body += struct.pack('!hh', 0, 0)
+    return finish_frame(0xAA01, body)
+
+
+class FakePdc:
+    """ PDC which answers CONFIG2, DATAON and DATAOFF commands. Every
+    connection uses the next (cfgcnt, phasors_num, frames_num) layout,
+    the connection is closed after frames_num data frames. Data frames
+    are sent in bursts, so some of them are still in the socket when
+    DATAOFF is received. """
+
+    def __init__(self, layouts):
+        self.layouts = list(layouts)
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+        self.port = self.listener.getsockname()[1]
+        self.connections_num = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.__serve, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.listener.close()
+
+    def __serve(self):
+        self.listener.settimeout(0.05)
+        while not self.stopped.is_set():
+            try:
+                conn, _ = self.listener.accept()
+            except socket.timeout:
+                continue
+            layout = self.layouts[min(self.connections_num,
+                                      len(self.layouts) - 1)]
+            self.connections_num += 1
+            with conn:
+                self.__handle(conn, *layout)
+
+    def __handle(self, conn, cfgcnt, phasors_num, frames_num):
+        conn.settimeout(0.01)
+        data_on = False
+        sent_num = 0
+        while not self.stopped.is_set() and sent_num < frames_num:
+            try:
+                command = conn.recv(18)
+            except socket.timeout:
+                command = b''
+            except OSError:
+                return
+            if len(command) == 18:
+                cmd = struct.unpack_from('!H', command, 14)[0]
+                if cmd == CMD_CONFIG2:
+                    conn.sendall(config_frame(cfgcnt, phasors_num))
+                elif cmd == CMD_DATAON:
+                    data_on = True
+                elif cmd == CMD_DATAOFF:
+                    data_on = False
+            if data_on:
+                burst = b''.join(data_frame(sent_num + ind, phasors_num)
+                                 for ind in range(5))
+                conn.sendall(burst)
+                sent_num += 5
+
+
+class TestSupervisedStreamDataReader(unittest.TestCase):
+
+    def test_config_change_across_reconnect(self):
+        pdc = FakePdc([(1, 2, 20), (2, 3, 10**6)])
+        reader = SupervisedStreamDataReader(
+            '127.0.0.1', pdc.port, IDCODE, stall_timeout=1,
+            backoff_min=0.05, backoff_max=0.1)
+        # endless reconnection fails the test instead of hanging it
+        watchdog = threading.Timer(10, reader.close)
+        watchdog.start()
+        try:
+            samples = [reader.get_selected_samples() for _ in range(40)]
+        finally:
+            watchdog.cancel()
+            reader.close()
+            pdc.stop()
+
+        self.assertTrue(all(samples), "Reader is closed by watchdog")
+        self.assertEqual(pdc.connections_num, 2)
+        self.assertEqual(reader.reconnects_num, 1)
+        self.assertEqual(reader.config_frame().stations[0].cfgcnt, 2)
+        self.assertEqual(len(samples[0][0].stations[0].phasors), 2)
+        self.assertEqual(len(samples[-1][0].stations[0].phasors), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()